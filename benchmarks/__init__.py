@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+"""Benchmarks for flask-multi-redis, run without Redis servers.
+
+Usage: python -m benchmarks --help
+"""
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+"""Run the benchmark suite."""
+
+from benchmarks.suite import main
+
+main()
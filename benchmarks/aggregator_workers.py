@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Compare Aggregator fan-out with spawned threads and with a WorkerPool.
+
+Usage: python -m benchmarks.aggregator_workers [nodes] [calls] [clients]
+"""
+
+from __future__ import print_function
+
+import sys
+
+from benchmarks.suite import HEADER, report, run_benchmark
+
+
+def main():
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    clients = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    print('{0:>6} {1}'.format('mode', HEADER))
+    for name, workers in (('spawn', 0), ('pool', 4 * nodes)):
+        result = run_benchmark('aggregate', nodes, 'get', calls, clients,
+                               workers=workers)
+        print('{0:>6} {1}'.format(name, report(result)))
+
+
+if __name__ == '__main__':
+    main()
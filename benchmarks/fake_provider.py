@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+"""In-process fake Redis provider with injected latency."""
+
+from fnmatch import fnmatch
+from random import uniform
+from threading import Lock
+from time import sleep
+
+
+def fake_provider(latency=0.0005, jitter=0.0):
+    """Return a FakeRedis class answering after latency +/- jitter seconds.
+
+    Every host gets its own keyspace, shared by clients of the same host.
+    """
+    return type('FakeRedis', (FakeRedis,), {
+        'latency': latency,
+        'jitter': jitter,
+        'servers': {}
+    })
+
+
+class FakePipeline(object):
+
+    """Buffer commands and run them in a single simulated round trip."""
+
+    def __init__(self, client):
+        """Initialize FakePipeline."""
+        self._client = client
+        self._commands = []
+
+    def __getattr__(self, name):
+        def command(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return command
+
+    def execute(self):
+        """Run buffered commands."""
+        self._client.wait()
+        commands, self._commands = self._commands, []
+        return [getattr(self._client, '_' + name)(*args, **kwargs)
+                for name, args, kwargs in commands]
+
+
+class FakeRedis(object):
+
+    """Subset of the redis-py client API kept in memory.
+
+    Use fake_provider() to get a subclass with its own latency and data.
+    """
+
+    latency = 0.0
+    jitter = 0.0
+    servers = {}
+
+    def __init__(self, host='localhost', port=6379, db=0, **kwargs):
+        """Initialize FakeRedis."""
+        key = (host, port, db)
+        if key not in self.servers:
+            self.servers[key] = ({}, Lock())
+        self.data, self._lock = self.servers[key]
+
+    def wait(self):
+        """Sleep for a simulated network round trip."""
+        delay = self.latency + uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            sleep(delay)
+
+    def pipeline(self, transaction=True):
+        """Return a pipeline running commands in a single round trip."""
+        return FakePipeline(self)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        # Public commands cost a round trip, their _name twin does the work
+        command = getattr(self, '_' + name)
+
+        def call(*args, **kwargs):
+            self.wait()
+            return command(*args, **kwargs)
+        call.__name__ = name
+        return call
+
+    def _ping(self):
+        return True
+
+    def _get(self, name):
+        return self.data.get(name)
+
+    def _ttl(self, name):
+        return -1 if name in self.data else -2
+
+    def _set(self, name, value, **kwargs):
+        with self._lock:
+            self.data[name] = value
+        return True
+
+    def _mget(self, keys, *args):
+        return [self.data.get(key) for key in list(keys) + list(args)]
+
+    def _mset(self, mapping):
+        with self._lock:
+            self.data.update(mapping)
+        return True
+
+    def _delete(self, *names):
+        with self._lock:
+            deleted = [name for name in names if name in self.data]
+            for name in deleted:
+                del self.data[name]
+        return len(deleted)
+
+    def _keys(self, pattern='*'):
+        return [key for key in list(self.data) if fnmatch(key, pattern)]
+
+    def _scan(self, cursor=0, match=None, count=None):
+        keys = sorted(self._keys(match or '*'))
+        count = count or 10
+        if cursor + count >= len(keys):
+            return 0, keys[cursor:]
+        return cursor + count, keys[cursor:cursor + count]
+
+    def scan_iter(self, match=None, count=None):
+        """Iterate over keys, one simulated round trip per SCAN page."""
+        cursor = None
+        while cursor != 0:
+            self.wait()
+            cursor, keys = self._scan(cursor or 0, match, count)
+            for key in keys:
+                yield key
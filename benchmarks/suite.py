@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+"""Measure FlaskMultiRedis throughput, latency and memory per strategy."""
+
+from __future__ import print_function
+
+from argparse import ArgumentParser
+from threading import Thread
+from time import time
+
+from flask import Flask
+from flask_multi_redis.main import FlaskMultiRedis
+
+from benchmarks.fake_provider import fake_provider
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+STRATEGIES = ('loadbalancing', 'aggregate')
+NODES = (1, 2, 4, 8, 16, 32)
+
+
+def _get(redis, number):
+    redis.get('key:{0}'.format(number))
+
+
+def _set(redis, number):
+    redis.set('key:{0}'.format(number), 'value')
+
+
+def _keys(redis, number):
+    redis.keys('key:1*')
+
+
+def _delete(redis, number):
+    redis.delete('key:{0}'.format(number))
+
+
+def _scan_iter(redis, number):
+    list(redis.scan_iter(match='key:1*', count=100))
+
+
+OPERATIONS = {
+    'get': _get,
+    'set': _set,
+    'keys': _keys,
+    'delete': _delete,
+    'scan_iter': _scan_iter
+}
+
+
+def percentile(values, percent):
+    """Return the percent-th percentile of values."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def create(strategy, nodes, latency=0.0005, jitter=0.0, keys=1000,
+           workers=None):
+    """Create a FlaskMultiRedis instance over nodes fake Redis servers.
+
+    Every server is loaded with the same keys beforehand.
+    """
+    app = Flask(__name__)
+    app.config['REDIS_NODES'] = [{'host': 'node{0}'.format(i)}
+                                 for i in range(nodes)]
+    if workers is not None:
+        app.config['REDIS_AGGREGATE_WORKERS'] = workers
+    provider = fake_provider(latency, jitter)
+    redis = FlaskMultiRedis.from_custom_provider(provider, app,
+                                                 strategy=strategy)
+    mapping = dict(('key:{0}'.format(i), 'value') for i in range(keys))
+    for node in redis._redis_nodes:
+        node._redis_client._mset(mapping)
+    return redis
+
+
+def _drive(redis, operation, calls, clients, keys):
+    latencies = []
+
+    def client(offset):
+        for number in range(offset, offset + calls):
+            start = time()
+            operation(redis, number % keys)
+            latencies.append(time() - start)
+
+    threads = [Thread(target=client, args=(i * calls,))
+               for i in range(clients)]
+    start = time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time() - start, latencies
+
+
+def run_benchmark(strategy, nodes, operation, calls=200, clients=4,
+                  latency=0.0005, jitter=0.0, keys=1000, workers=None):
+    """Run operation calls times from each client thread.
+
+    Return ops/s, p50 and p99 latencies in seconds and, when tracemalloc is
+    available, peak memory allocated during a shorter second pass, so that
+    tracing does not slow down the timed pass.
+    """
+    target = OPERATIONS[operation]
+    redis = create(strategy, nodes, latency, jitter, keys, workers)
+    try:
+        elapsed, latencies = _drive(redis, target, calls, clients, keys)
+        peak = None
+        if tracemalloc is not None:
+            tracemalloc.start()
+            try:
+                _drive(redis, target, max(calls // 10, 1), clients, keys)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    finally:
+        redis.close()
+    return {
+        'strategy': strategy,
+        'nodes': nodes,
+        'operation': operation,
+        'ops': len(latencies) / elapsed,
+        'p50': percentile(latencies, 50),
+        'p99': percentile(latencies, 99),
+        'peak': peak
+    }
+
+
+def report(result):
+    """Format a run_benchmark result as a table row."""
+    peak = '-'
+    if result['peak'] is not None:
+        peak = '{0:.0f}'.format(result['peak'] / 1024.0)
+    return '{0:<14} {1:>5} {2:<10} {3:>10.0f} {4:>9.3f} {5:>9.3f} {6:>9}' \
+        .format(result['strategy'], result['nodes'], result['operation'],
+                result['ops'], result['p50'] * 1000, result['p99'] * 1000,
+                peak)
+
+
+HEADER = '{0:<14} {1:>5} {2:<10} {3:>10} {4:>9} {5:>9} {6:>9}'.format(
+    'strategy', 'nodes', 'operation', 'ops/s', 'p50 ms', 'p99 ms', 'peak KiB'
+)
+
+
+def _list(cast):
+    return lambda value: [cast(item) for item in value.split(',')]
+
+
+def main(argv=None):
+    """Run benchmarks for every strategy, node count and operation."""
+    parser = ArgumentParser(prog='python -m benchmarks',
+                            description=__doc__)
+    parser.add_argument('--strategies', type=_list(str),
+                        default=list(STRATEGIES))
+    parser.add_argument('--nodes', type=_list(int), default=list(NODES))
+    parser.add_argument('--operations', type=_list(str),
+                        default=sorted(OPERATIONS))
+    parser.add_argument('--calls', type=int, default=200,
+                        help='calls per client thread')
+    parser.add_argument('--clients', type=int, default=4,
+                        help='concurrent client threads')
+    parser.add_argument('--latency', type=float, default=0.0005,
+                        help='simulated round trip in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0002,
+                        help='random latency variation in seconds')
+    parser.add_argument('--keys', type=int, default=1000,
+                        help='keys loaded on every node')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='REDIS_AGGREGATE_WORKERS')
+    args = parser.parse_args(argv)
+
+    print(HEADER)
+    for strategy in args.strategies:
+        for nodes in args.nodes:
+            for operation in args.operations:
+                print(report(run_benchmark(
+                    strategy, nodes, operation, args.calls, args.clients,
+                    args.latency, args.jitter, args.keys, args.workers
+                )))
@@ -4,4 +4,10 @@
 
 __version__ = '0.1.5'
 
-__all__ = ('aggregator', 'redis_node', 'main')
+# async_aggregator, async_main and async_tracking need Python 3.6 or later,
+# import them explicitly
+__all__ = ('aggregator', 'redis_node', 'main', 'worker_pool', 'hash_ring',
+           'sharder', 'health', 'balancer', 'local_cache', 'write_behind',
+           'instrumentation', 'connection_pool', 'merge_policies',
+           'scripts', 'replicator', 'repair', 'request_cache', 'batcher',
+           'serialization')
@@ -2,14 +2,16 @@
 
 """flask-multi-redis aggregator module."""
 
-from itertools import chain
+from heapq import merge
+from itertools import groupby, islice
 from random import randint
 from sys import version_info
-from threading import Thread
+from time import time
 
-from more_itertools import unique_everseen
-
-# from collections import OrderedDict
+from flask_multi_redis.merge_policies import (COMMANDS, READ_COMMANDS,
+                                              _newest, resolve)
+from flask_multi_redis.repair import authority, lags, repair
+from flask_multi_redis.worker_pool import WorkerPool
 
 if version_info < (3,):
     import Queue as queue
@@ -17,77 +19,508 @@ else:
     import queue
 
 
+READ_STRATEGIES = ('all', 'first', 'quorum')
+
+
+def _get_with_ttl(node, pattern):
+    """Fetch value and TTL of a key in a single round trip."""
+    pipe = node.pipeline(transaction=False)
+    pipe.get(pattern)
+    pipe.ttl(pattern)
+    result, result_ttl = pipe.execute()
+    return result_ttl or 1, result
+
+
+def _command_name(target):
+    """Name a job after its target function, for instrumentation."""
+    return getattr(target, '__name__', 'call').lstrip('_')
+
+
+def _list_or_args(keys, args):
+    """Merge keys and args the way redis-py does for multi-key commands."""
+    if isinstance(keys, (list, tuple)):
+        keys = list(keys)
+    else:
+        keys = [keys]
+    keys.extend(args)
+    return keys
+
+
+class SeenKeys(object):
+
+    """Remember recently seen keys within a bounded amount of memory.
+
+    Keys are kept in two generations of at most max_size / 2 keys each.
+    When the current one is full, the previous one is dropped, so a key
+    seen more than max_size / 2 keys ago may be reported as new again.
+    """
+
+    def __init__(self, max_size=100000):
+        """Initialize SeenKeys."""
+        self.max_size = max_size
+        self._current = set()
+        self._previous = set()
+
+    def add(self, key):
+        """Remember key, return False if it was already seen."""
+        if key in self._current or key in self._previous:
+            return False
+        if len(self._current) * 2 >= self.max_size:
+            self._previous = self._current
+            self._current = set()
+        self._current.add(key)
+        return True
+
+
+class AggregatedPipeline(object):
+
+    """Buffer commands and send them to every node in one batch per node.
+
+    Node batches run in parallel and replies are merged per command with
+    the merge policies of the aggregator, so get returns the value with
+    the highest TTL, set tells whether nodes agreed and delete sums deleted
+    keys. With transaction=True, each node runs its batch in a MULTI/EXEC
+    block, so commands are atomic on each node but not across nodes.
+    """
+
+    def __init__(self, aggregator, transaction=True):
+        """Initialize AggregatedPipeline."""
+        self._aggregator = aggregator
+        self.transaction = transaction
+        self._commands = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self._aggregator.commands:
+            message = '{0} is not implemented in pipelines yet.'.format(name)
+            message += ' Feel free to contribute.'
+            raise NotImplementedError(message)
+
+        def command(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+        return command
+
+    def reset(self):
+        """Drop buffered commands."""
+        self._commands = []
+
+    def _nodes(self):
+        return list(self._aggregator._redis_nodes)
+
+    def _parts(self, name, args, nodes):
+        """Return (node indexes, args) pairs to send a command as."""
+        return [(list(range(len(nodes))), args)]
+
+    def _merge(self, name, parts):
+        """Merge replies to a command, given as a list per part."""
+        merge_replies = resolve(self._aggregator.commands[name])
+        return merge_replies([x for part in parts for x in part])
+
+    def execute(self):
+        """Send buffered commands and return merged replies in order.
+
+        Nodes failing or answering after their socket_timeout are left out.
+        """
+        commands, self._commands = self._commands, []
+        nodes = self._nodes()
+        batches = {}
+        replies = []
+        for command_index, (name, args, kwargs) in enumerate(commands):
+            parts = self._parts(name, args, nodes)
+            replies.append([[] for _ in parts])
+            for part_index, (indexes, part_args) in enumerate(parts):
+                for index in indexes:
+                    batches.setdefault(index, []).append(
+                        (command_index, part_index, name, part_args, kwargs)
+                    )
+
+        # Commands merged by TTL are sent along with a TTL of their key
+        with_ttl = set(name for name, _, _ in commands
+                       if self._aggregator.commands[name] == 'max_ttl')
+
+        def _execute(node, batch, transaction):
+            pipe = node.pipeline(transaction=transaction)
+            for _, _, name, args, kwargs in batch:
+                getattr(pipe, name)(*args, **kwargs)
+                if name in with_ttl:
+                    pipe.ttl(args[0])
+            results = iter(pipe.execute())
+            merged = []
+            for _, _, name, _, _ in batch:
+                result = next(results)
+                if name in with_ttl:
+                    result = (next(results) or 1, result)
+                merged.append(result)
+            return merged
+        indexes = sorted(batches)
+        jobs = [(nodes[index], _execute, (batches[index], self.transaction),
+                 {}) for index in indexes]
+        for job, results in self._aggregator._iter_jobs(jobs):
+            for entry, result in zip(batches[indexes[job]], results):
+                replies[entry[0]][entry[1]].append(result)
+        return [self._merge(command[0], parts)
+                for command, parts in zip(commands, replies)]
+
+
 class Aggregator(object):
 
     """Reimplement Redis commands with aggregation from multiple servers."""
 
-    def __init__(self, redis_nodes):
+    def __init__(self, redis_nodes, pool=None, read_strategy='all',
+                 quorum=None):
         """Initialize Aggregator."""
-        self._output_queue = queue.Queue()
+        assert read_strategy in READ_STRATEGIES
         self._redis_nodes = redis_nodes
+        self._pool = pool if pool is not None else WorkerPool()
+        self.read_strategy = read_strategy
+        self.quorum = quorum
+        self.write_behind = None
+        self.instrumentation = None
+        self.read_repair = False
+        self.batcher = None
+        self.commands = dict(COMMANDS)
+        self.read_commands = set(READ_COMMANDS)
 
-    def _runner(self, target, pattern, **kwargs):
-        threads = []
-        results = []
-        for node in self._redis_nodes:
-            worker = Thread(target=target, args=(node, pattern), kwargs=kwargs)
-            worker.start()
-            threads.append({
-                'worker': worker,
-                'timeout': node.config['socket_timeout']
-            })
-        for thread in threads:
-            thread['worker'].join(thread['timeout'])
-        while not self._output_queue.empty():
-            item = self._output_queue.get()
-            self._output_queue.task_done()
-            results.append(item)
-        return results
-
-    def get(self, pattern):
-        """Aggregated get method."""
-        def _get(node, pattern):
-            result = node.get(pattern)
-            if result:
-                self._output_queue.put((node.ttl(pattern) or 1, result))
-        results = self._runner(_get, pattern)
-        if results:
-            results.sort(key=lambda t: t[0])
-            return results[-1][1]
-
-    def keys(self, pattern):
-        """Aggregated keys method."""
+    def _iter_jobs(self, jobs):
+        """Run (node, target, args, kwargs) jobs, yield (index, result).
+
+        Each call collects its results in its own queue, so concurrent
+        calls never see each other's results. Jobs failing or answering
+        after their node socket_timeout are left out.
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.record_fanout(len(jobs))
+        done = queue.Queue()
+        start = time()
+        tasks = []
+        timeouts = [job[0].config['socket_timeout'] for job in jobs]
+        for index, (node, target, args, kwargs) in enumerate(jobs):
+            task = self._pool.submit(target, node, *args, **kwargs)
+            task.add_done_callback(
+                lambda task, index=index: done.put((index, task))
+            )
+            if instrumentation is not None and timeouts[index] is not None:
+                task.add_done_callback(
+                    lambda task, job=jobs[index], timeout=timeouts[index]:
+                    self._record_late(task, job, start, timeout)
+                )
+            tasks.append(task)
+        deadline = None
+        if None not in timeouts and timeouts:
+            deadline = start + max(timeouts)
+        try:
+            for _ in jobs:
+                try:
+                    if deadline is None:
+                        index, task = done.get()
+                    else:
+                        wait = max(deadline - time(), 0)
+                        index, task = done.get(timeout=wait)
+                except queue.Empty:
+                    if instrumentation is not None:
+                        self._record_timeouts(jobs, tasks)
+                    break
+                timeout = timeouts[index]
+                if timeout is not None and time() - start > timeout:
+                    continue
+                if task.exception is None:
+                    yield index, task.result
+        finally:
+            # Callers may stop early, do not run what is left for nothing
+            for task in tasks:
+                task.cancel()
+
+    def _record_late(self, task, job, start, timeout):
+        """Record a finished job if it came after its node timeout.
+
+        Latencies are recorded by the nodes themselves, once per client
+        command or pipeline, so that jobs are not counted twice.
+        """
+        if task.started and time() - start > timeout:
+            self.instrumentation.record_late(job[0].name,
+                                             _command_name(job[1]))
+
+    def _record_timeouts(self, jobs, tasks):
+        for job, task in zip(jobs, tasks):
+            if not task.done():
+                self.instrumentation.record_timeout(job[0].name,
+                                                    _command_name(job[1]))
+
+    def _iter_results(self, target, *args, **kwargs):
+        """Run target on every node, yield (node, result) as they come."""
+        nodes = list(self._redis_nodes)
+        results = self._iter_jobs(
+            [(node, target, args, kwargs) for node in nodes]
+        )
+        try:
+            for index, result in results:
+                yield nodes[index], result
+        finally:
+            results.close()
+
+    def _runner(self, target, *args, **kwargs):
+        """Run target on every node, return (node, result) pairs."""
+        return list(self._iter_results(target, *args, **kwargs))
+
+    def get(self, pattern, ttl=True, read_strategy=None, quorum=None):
+        """Aggregated get method.
+
+        Each node sends back value and TTL in a single pipelined round trip.
+        With the 'all' read strategy, every node is waited for and the value
+        with the highest TTL wins. With 'first' (or ttl=False), only GET is
+        sent and the first non-empty answer is returned. With 'quorum', the
+        first value returned by quorum nodes (a majority by default) wins.
+        With a batcher set, concurrent 'all' reads share a single mget.
+        """
+        read_strategy = read_strategy or self.read_strategy
+        assert read_strategy in READ_STRATEGIES
+        if not ttl or read_strategy == 'first':
+            return self._get_first(pattern)
+        if read_strategy == 'quorum':
+            return self._get_quorum(pattern, quorum or self.quorum)
+        if self.batcher is not None and not self.read_repair:
+            return self.batcher.get(pattern)
+        return self.get_with_ttl(pattern)[1]
+
+    def get_with_ttl(self, pattern):
+        """Aggregated get method, returning the newest (ttl, value) pair.
+
+        TTL is left unknown with read strategies other than 'all'. With
+        read_repair set, nodes lagging behind the authority of answers are
+        repaired in the background.
+        """
+        if self.read_strategy != 'all':
+            return None, self.get(pattern)
+        results = self._runner(_get_with_ttl, pattern)
+        winner = _newest([x for _, x in results])
+        source = authority([x for _, x in results])
+        if self.read_repair and source is not None:
+            for node, answer in results:
+                if lags(answer, source):
+                    self._pool.submit(repair, node, pattern, answer[1],
+                                      source)
+        return winner
+
+    def _get_first(self, pattern):
+        def _get_value(node, pattern):
+            return node.get(pattern)
+        results = self._iter_results(_get_value, pattern)
+        try:
+            for _, result in results:
+                if result:
+                    return result
+        finally:
+            results.close()
+
+    def _get_quorum(self, pattern, quorum):
+        if not quorum:
+            quorum = len(self._redis_nodes) // 2 + 1
+        votes = {}
+        answers = []
+        results = self._iter_results(_get_with_ttl, pattern)
+        try:
+            for _, answer in results:
+                votes[answer[1]] = votes.get(answer[1], 0) + 1
+                if votes[answer[1]] >= quorum:
+                    return answer[1]
+                answers.append(answer)
+        finally:
+            results.close()
+        # Nodes do not agree enough, fall back to the newest value
+        return _newest(answers)[1]
+
+    def keys(self, pattern='*', scan=False, count=None, limit=None,
+             offset=0):
+        """Aggregated keys method.
+
+        Each node sorts its own keys, then node lists are k-way merged
+        without duplicates. With scan=True, keys are listed with SCAN
+        instead of a blocking KEYS on each node. limit and offset select
+        a slice of the merged list.
+        """
+        keys = self.iter_keys(pattern, scan, count)
+        stop = None if limit is None else offset + limit
+        return list(islice(keys, offset, stop))
+
+    def iter_keys(self, pattern='*', scan=False, count=None):
+        """Aggregated keys iterator, yielding sorted keys once each.
+
+        Nodes are listed as with keys, with a blocking KEYS unless scan=True.
+        """
         def _keys(node, pattern):
-            for result in node.keys(pattern):
-                self._output_queue.put(result)
-        results = self._runner(_keys, pattern)
-        # return list(OrderedDict.fromkeys(results))
-        return sorted(list(unique_everseen(results)))
+            if scan:
+                return sorted(node.scan_iter(match=pattern, count=count))
+            return sorted(node.keys(pattern))
+        results = [x for _, x in self._runner(_keys, pattern)]
+        for key, _ in groupby(merge(*results)):
+            yield key
 
     def set(self, key, pattern, **kwargs):
-        """Aggregated set method."""
+        """Aggregated set method.
+
+        In write-behind mode, the write is queued and True is returned
+        unless the queue was full.
+        """
+        if self.write_behind is not None:
+            return self.write_behind.set(key, pattern, **kwargs)
+
         def _set(node, pattern, key=key, **kwargs):
-            self._output_queue.put(node.set(key, pattern, **kwargs))
-        results = self._runner(_set, pattern, **kwargs)
+            return node.set(key, pattern, **kwargs)
+        results = [x for _, x in self._runner(_set, pattern, **kwargs)]
         return len(set(results)) <= 1
 
-    def _aggregated_put(self, pattern, method):
-        """Default aggregated put method."""
-        def _aggregated_method(node, pattern):
-            _method = getattr(node, method)
-            self._output_queue.put(_method(pattern))
-        return self._runner(_aggregated_method, pattern)
+    def mget(self, keys, *args):
+        """Aggregated mget method.
 
-    def delete(self, pattern):
-        """Aggregated delete method."""
-        results = self._aggregated_put(pattern, 'delete')
+        Each node gets one pipelined batch of GET and TTL commands. For
+        every key, the value with the highest TTL wins, as in get.
+        """
+        keys = _list_or_args(keys, args)
+
+        def _mget(node, keys):
+            pipe = node.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+                pipe.ttl(key)
+            replies = pipe.execute()
+            return list(zip(replies[::2], replies[1::2]))
+        values = [None] * len(keys)
+        ttls = [None] * len(keys)
+        for _, replies in self._runner(_mget, keys):
+            for index, (value, ttl) in enumerate(replies):
+                if value:
+                    ttl = ttl or 1
+                    if ttls[index] is None or ttl >= ttls[index]:
+                        values[index], ttls[index] = value, ttl
+        return values
+
+    def mset(self, mapping):
+        """Aggregated mset method."""
+        def _mset(node, mapping):
+            return node.mset(mapping)
+        results = [x for _, x in self._runner(_mset, mapping)]
+        return len(set(results)) <= 1
+
+    def delete(self, *names):
+        """Aggregated delete method.
+
+        In write-behind mode, deletions are queued and the number of
+        queued keys is returned.
+        """
+        if self.write_behind is not None:
+            return self.write_behind.delete(*names)
+
+        def _delete(node, names):
+            return node.delete(*names)
+        results = [x for _, x in self._runner(_delete, names)]
         return sum([x for x in results if isinstance(x, int)])
 
-    def scan_iter(self, pattern):
-        """Aggregated scan_iter method."""
-        results = self._aggregated_put(pattern, 'scan_iter')
-        print(results)
-        return chain(*results)
+    def scan_iter(self, match=None, count=None, max_seen=100000):
+        """Aggregated scan_iter method.
+
+        SCAN cursors of every node are walked concurrently: a node fetches
+        its next page while keys from its previous one are yielded. Keys
+        are yielded as they arrive and duplicates are removed with a
+        SeenKeys set holding at most max_seen keys.
+        """
+        def _scan(node, cursor):
+            return node.scan(cursor=cursor, match=match, count=count)
+        nodes = list(self._redis_nodes)
+        done = queue.Queue()
+        tasks = {}
+        seen = SeenKeys(max_seen)
+
+        def _submit(index, cursor):
+            task = self._pool.submit(_scan, nodes[index], cursor)
+            tasks[index] = task
+            task.add_done_callback(
+                lambda task: done.put((index, task))
+            )
+        for index in range(len(nodes)):
+            _submit(index, 0)
+        try:
+            while tasks:
+                timeouts = [nodes[index].config['socket_timeout']
+                            for index in tasks]
+                try:
+                    if None in timeouts:
+                        index, task = done.get()
+                    else:
+                        index, task = done.get(timeout=max(timeouts))
+                except queue.Empty:
+                    break
+                del tasks[index]
+                if task.exception is not None:
+                    continue
+                cursor, keys = task.result
+                if cursor:
+                    _submit(index, cursor)
+                for key in keys:
+                    if seen.add(key):
+                        yield key
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+    def pipeline(self, transaction=True):
+        """Return an AggregatedPipeline sending commands to every node."""
+        return AggregatedPipeline(self, transaction)
+
+    def run_script(self, script, keys=(), args=()):
+        """Run a Script on every node, merging replies with its policy."""
+        def _run_script(node, keys, args):
+            return script.run(node, keys, args)
+        results = self._runner(_run_script, keys, args)
+        return script.merge([x for _, x in results])
+
+    def register_command(self, name, policy, read_only=False):
+        """Aggregate command name, merging node replies with policy.
+
+        policy is a name from merge_policies.POLICIES or a function taking
+        the list of node replies. read_only tells whether the command only
+        reads data.
+        """
+        resolve(policy)
+        self.commands[name] = policy
+        if read_only:
+            self.read_commands.add(name)
+        else:
+            self.read_commands.discard(name)
+
+    def _command(self, name):
+        """Return a function running command name on every node."""
+        policy = self.commands[name]
+        merge_replies = resolve(policy)
+
+        def _call(node, *args, **kwargs):
+            return getattr(node, name)(*args, **kwargs)
+
+        def _call_with_ttl(node, *args, **kwargs):
+            pipe = node.pipeline(transaction=False)
+            getattr(pipe, name)(*args, **kwargs)
+            pipe.ttl(args[0])
+            result, result_ttl = pipe.execute()
+            return result_ttl or 1, result
+        target = _call_with_ttl if policy == 'max_ttl' else _call
+        target.__name__ = name
+
+        def command(*args, **kwargs):
+            results = self._runner(target, *args, **kwargs)
+            return merge_replies([x for _, x in results])
+        command.__name__ = name
+        return command
 
     def __getattr__(self, name):
         if name in ['_redis_client', 'connection_pool']:
@@ -95,6 +528,8 @@ class Aggregator(object):
                 return None
             rnd = randint(0, len(self._redis_nodes) - 1)
             return getattr(self._redis_nodes[rnd], name)
+        elif name in self.__dict__.get('commands', ()):
+            return self._command(name)
         else:
             message = '{0} is not implemented yet.'.format(name)
             message += ' Feel free to contribute.'
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis async_aggregator module."""
+
+import asyncio
+from heapq import merge
+from itertools import groupby
+from random import randint
+
+from flask_multi_redis.aggregator import SeenKeys
+
+
+class AsyncAggregator(object):
+
+    """Reimplement Redis commands with aggregation using asyncio."""
+
+    def __init__(self, redis_nodes):
+        """Initialize AsyncAggregator."""
+        self._redis_nodes = redis_nodes
+
+    @staticmethod
+    async def _call(target, node, *args, **kwargs):
+        timeout = node.config['socket_timeout']
+        return await asyncio.wait_for(target(node, *args, **kwargs), timeout)
+
+    async def _runner(self, target, *args, **kwargs):
+        """Run target on every node, return (node, result) pairs.
+
+        Nodes failing or answering after their socket_timeout are left out.
+        """
+        nodes = list(self._redis_nodes)
+        results = await asyncio.gather(
+            *[self._call(target, node, *args, **kwargs) for node in nodes],
+            return_exceptions=True
+        )
+        return [(node, result) for node, result in zip(nodes, results)
+                if not isinstance(result, BaseException)]
+
+    async def get(self, pattern):
+        """Aggregated get method."""
+        async def _get(node, pattern):
+            result = await node.get(pattern)
+            if result:
+                return (await node.ttl(pattern)) or 1, result
+        results = [x for _, x in await self._runner(_get, pattern) if x]
+        if results:
+            results.sort(key=lambda t: t[0])
+            return results[-1][1]
+
+    async def keys(self, pattern='*'):
+        """Aggregated keys method."""
+        async def _keys(node, pattern):
+            return sorted(await node.keys(pattern))
+        results = [x for _, x in await self._runner(_keys, pattern)]
+        return [key for key, _ in groupby(merge(*results))]
+
+    async def set(self, key, pattern, **kwargs):
+        """Aggregated set method."""
+        async def _set(node, pattern, **kwargs):
+            return await node.set(key, pattern, **kwargs)
+        results = [x for _, x in await self._runner(_set, pattern, **kwargs)]
+        return len(set(results)) <= 1
+
+    async def delete(self, pattern):
+        """Aggregated delete method."""
+        async def _delete(node, pattern):
+            return await node.delete(pattern)
+        results = [x for _, x in await self._runner(_delete, pattern)]
+        return sum([x for x in results if isinstance(x, int)])
+
+    async def scan_iter(self, match=None, count=None, max_seen=100000):
+        """Aggregated scan_iter method.
+
+        SCAN cursors of every node are walked concurrently and keys are
+        yielded as pages arrive, so that a single page per node is held in
+        memory. Duplicates are removed with a SeenKeys set holding at most
+        max_seen keys.
+        """
+        async def _scan(node, cursor):
+            return await node.scan(cursor=cursor, match=match, count=count)
+        seen = SeenKeys(max_seen)
+        tasks = {}
+
+        def _submit(node, cursor):
+            task = asyncio.ensure_future(self._call(_scan, node, cursor))
+            tasks[task] = node
+        for node in self._redis_nodes:
+            _submit(node, 0)
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(
+                    list(tasks), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    node = tasks.pop(task)
+                    if task.cancelled() or task.exception() is not None:
+                        # Nodes failing or timing out are left out
+                        continue
+                    cursor, keys = task.result()
+                    if cursor:
+                        _submit(node, cursor)
+                    for key in keys:
+                        if seen.add(key):
+                            yield key
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def __getattr__(self, name):
+        if name in ['_redis_client', 'connection_pool']:
+            if len(self._redis_nodes) == 0:
+                return None
+            rnd = randint(0, len(self._redis_nodes) - 1)
+            return getattr(self._redis_nodes[rnd], name)
+        else:
+            message = '{0} is not implemented yet.'.format(name)
+            message += ' Feel free to contribute.'
+            raise NotImplementedError(message)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis async_main module."""
+
+try:
+    from redis import asyncio as redis_asyncio
+except ImportError:
+    # We can allow custom provider only usage without redis-py being installed
+    redis_asyncio = None
+
+from flask_multi_redis.async_aggregator import AsyncAggregator
+from flask_multi_redis.main import FlaskMultiRedis
+
+# Settings of features running synchronous code, refused when enabled
+UNSUPPORTED_SETTINGS = [
+    'SERIALIZER', 'COMPRESSION', 'LOCAL_CACHE_MAX_ENTRIES',
+    'LOCAL_CACHE_INVALIDATION', 'REQUEST_CACHE', 'READ_REPAIR',
+    'ANTI_ENTROPY_INTERVAL', 'WRITE_BEHIND', 'BATCH_WINDOW'
+]
+
+
+class AsyncFlaskMultiRedis(FlaskMultiRedis):
+
+    """FlaskMultiRedis flavour whose commands are coroutines.
+
+    Only the loadbalancing and aggregate strategies are available, and
+    settings listed in UNSUPPORTED_SETTINGS must be left disabled. Nodes
+    whose circuit is open are not probed in the background, since pings are
+    coroutines too: once the reset timeout is elapsed, the next requests
+    are sent to them and decide if their circuit closes again.
+    """
+
+    def __init__(self, app=None, strict=True, **kwargs):
+        """Initialize AsyncFlaskMultiRedis."""
+        assert kwargs.get('strategy', 'loadbalancing') in \
+            ['loadbalancing', 'aggregate'], \
+            'only loadbalancing and aggregate strategies are asynchronous'
+        super(AsyncFlaskMultiRedis, self).__init__(strict=strict, **kwargs)
+        self.provider_class = None
+        if redis_asyncio:
+            self.provider_class = redis_asyncio.StrictRedis if strict \
+                else redis_asyncio.Redis
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize AsyncFlaskMultiRedis with a Flask app."""
+        for setting in UNSUPPORTED_SETTINGS:
+            name = '{0}_{1}'.format(self.config_prefix, setting)
+            assert not app.config.get(name), \
+                '{0} is not supported by AsyncFlaskMultiRedis'.format(name)
+        super(AsyncFlaskMultiRedis, self).init_app(app)
+        self._health_checker = None
+        for node in self._redis_nodes:
+            node.circuit.on_open = None
+
+    def _pick_node(self):
+        """Pick a node with the balancer, trying half-open circuits."""
+        nodes = [node for node in self._redis_nodes
+                 if node.circuit.available() or node.circuit.should_probe()]
+        return self._balancer.pick(nodes or self._redis_nodes)
+
+    def _init_aggregator(self, app):
+        self._aggregator = AsyncAggregator(self._redis_nodes)
+
+    def __getitem__(self, name):
+        return self._getitem(name)
+
+    async def _getitem(self, name):
+        if len(self._redis_nodes) == 0:
+            return None
+        if self._strategy == 'aggregate':
+            return await self._aggregator.get(name)
+        else:
+            return await self._pick_node().get(name)
+
+    def __setitem__(self, name, value):
+        raise TypeError('use "await redis_store.set(name, value)" instead')
+
+    def __delitem__(self, name):
+        raise TypeError('use "await redis_store.delete(name)" instead')
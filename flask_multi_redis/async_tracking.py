@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis async_tracking module."""
+
+
+async def track_awaitable(method, start, awaitable):
+    """Await a client coroutine, reporting its outcome to the node."""
+    error = None
+    try:
+        return await awaitable
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        method.end(start, error)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis balancer module."""
+
+from bisect import bisect
+from random import randint, random, sample
+from threading import Lock
+
+
+class NodeStats(object):
+
+    """Count requests sent to a node and keep track of its latency."""
+
+    def __init__(self, alpha=0.3):
+        """Initialize NodeStats."""
+        self.alpha = alpha
+        self.requests = 0
+        self.errors = 0
+        self.outstanding = 0
+        self.latency = None
+        self._lock = Lock()
+
+    def begin(self):
+        """Record the start of a request."""
+        with self._lock:
+            self.outstanding += 1
+
+    def end(self, latency, failed=False):
+        """Record the end of a request and its latency in seconds."""
+        with self._lock:
+            self.outstanding -= 1
+            self.requests += 1
+            if failed:
+                self.errors += 1
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.alpha * (latency - self.latency)
+
+    def snapshot(self):
+        """Return current statistics as a dictionary."""
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'outstanding': self.outstanding,
+            'latency': self.latency
+        }
+
+
+class RandomBalancer(object):
+
+    """Pick nodes uniformly at random."""
+
+    @staticmethod
+    def pick(nodes):
+        """Pick a node among nodes."""
+        return nodes[randint(0, len(nodes) - 1)]
+
+
+class WeightedBalancer(object):
+
+    """Pick nodes at random, proportionally to their weight."""
+
+    @staticmethod
+    def pick(nodes):
+        """Pick a node among nodes."""
+        cumulated = []
+        total = 0
+        for node in nodes:
+            total += getattr(node, 'weight', 1)
+            cumulated.append(total)
+        if total <= 0:
+            return RandomBalancer.pick(nodes)
+        return nodes[min(bisect(cumulated, random() * total), len(nodes) - 1)]
+
+
+class PowerOfTwoBalancer(object):
+
+    """Pick the fastest of two random nodes, by average latency."""
+
+    @staticmethod
+    def pick(nodes):
+        """Pick a node among nodes."""
+        if len(nodes) < 2:
+            return nodes[0]
+        first, second = sample(nodes, 2)
+        # Nodes never used yet have no latency and get tried first
+        if first.stats.latency is None:
+            return first
+        if second.stats.latency is None:
+            return second
+        if second.stats.latency < first.stats.latency:
+            return second
+        return first
+
+
+class LeastOutstandingBalancer(object):
+
+    """Pick the node with the fewest requests in flight."""
+
+    @staticmethod
+    def pick(nodes):
+        """Pick a node among nodes."""
+        fewest = min(node.stats.outstanding for node in nodes)
+        nodes = [node for node in nodes if node.stats.outstanding == fewest]
+        return RandomBalancer.pick(nodes)
+
+
+BALANCERS = {
+    'random': RandomBalancer,
+    'weighted': WeightedBalancer,
+    'p2c': PowerOfTwoBalancer,
+    'least_outstanding': LeastOutstandingBalancer
+}
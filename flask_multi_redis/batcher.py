@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis batcher module."""
+
+from threading import Event, Lock
+
+
+class _Batch(object):
+
+    """Keys collected during one batching window."""
+
+    def __init__(self):
+        """Initialize _Batch."""
+        self.keys = []
+        self.positions = {}
+        self.full = Event()
+        self.done = Event()
+        self.values = None
+        self.exception = None
+
+
+class Batcher(object):
+
+    """Merge concurrent single-key reads into one multi-key read.
+
+    The first caller opens a batch and waits up to window seconds, or until
+    max_keys distinct keys were asked for, while other callers add their
+    keys to it. It then fetches every key at once with fetch, a function
+    taking a list of keys and returning their values, and hands each caller
+    its own value.
+    """
+
+    def __init__(self, fetch, window=0.0002, max_keys=64):
+        """Initialize Batcher."""
+        self.window = window
+        self.max_keys = max_keys
+        self.batches = 0
+        self.reads = 0
+        self.keys = 0
+        self._fetch = fetch
+        self._batch = None
+        self._lock = Lock()
+
+    def get(self, key):
+        """Return the value of key, fetched along with other callers."""
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = _Batch()
+            if key not in batch.positions:
+                batch.positions[key] = len(batch.keys)
+                batch.keys.append(key)
+            position = batch.positions[key]
+            self.reads += 1
+            if len(batch.keys) >= self.max_keys:
+                # Later callers open a new batch
+                self._batch = None
+                batch.full.set()
+        if leader:
+            self._run(batch)
+        else:
+            batch.done.wait()
+        if batch.exception is not None:
+            raise batch.exception
+        return batch.values[position]
+
+    def _run(self, batch):
+        """Wait for the batch to fill up, then fetch its keys."""
+        batch.full.wait(self.window)
+        with self._lock:
+            if self._batch is batch:
+                self._batch = None
+            self.batches += 1
+            self.keys += len(batch.keys)
+        try:
+            batch.values = self._fetch(batch.keys)
+        except Exception as exc:  # pylint: disable=broad-except
+            batch.exception = exc
+        finally:
+            batch.done.set()
+
+    def stats(self):
+        """Return batching counters as a dictionary."""
+        return {
+            'batches': self.batches,
+            'reads': self.reads,
+            'keys': self.keys
+        }
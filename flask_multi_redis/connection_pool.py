@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis connection_pool module."""
+
+import os
+from threading import Lock
+
+try:
+    import redis
+except ImportError:
+    # We can allow custom provider only usage without redis-py being installed
+    redis = None
+
+POOL_OPTIONS = ('max_connections', 'socket_keepalive', 'health_check_interval')
+
+
+def _freeze(value):
+    """Turn a configuration value into something hashable."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(value[key])) for key in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _is_redis_py(provider_class):
+    return redis is not None and isinstance(provider_class, type) and \
+        issubclass(provider_class, redis.Redis)
+
+
+def _use_blocking_pool(client, max_connections, timeout):
+    """Replace the pool of client with a BlockingConnectionPool.
+
+    The pool built by the client is reused as a template, so that redis-py
+    keeps sorting out connection arguments from client arguments.
+    """
+    pool = client.connection_pool
+    client.connection_pool = redis.BlockingConnectionPool(
+        connection_class=pool.connection_class,
+        max_connections=max_connections or 50, timeout=timeout,
+        **pool.connection_kwargs
+    )
+    pool.disconnect()
+
+
+class ClientRegistry(object):
+
+    """Share redis-py clients and their pools between identical nodes.
+
+    Nodes with the same configuration, even from other FlaskMultiRedis
+    instances, get the same client. Pools drop connections inherited from a
+    parent process after fork(), so that a worker never talks over a socket
+    opened by its master. Custom providers get a client of their own, built
+    as before.
+    """
+
+    def __init__(self):
+        """Initialize ClientRegistry."""
+        self._clients = {}
+        self._lock = Lock()
+
+    def get(self, provider_class, config, pool_config=None):
+        """Return a client for config, creating it on first request.
+
+        pool_config may hold max_connections, socket_keepalive,
+        health_check_interval, blocking_pool and pool_timeout.
+        """
+        if not _is_redis_py(provider_class):
+            return provider_class(**config)
+        pool_config = pool_config or {}
+        config = dict(config)
+        for option in POOL_OPTIONS:
+            if pool_config.get(option):
+                config[option] = pool_config[option]
+        blocking = pool_config.get('blocking_pool', False)
+        timeout = pool_config.get('pool_timeout', 20)
+        key = (provider_class, _freeze(config), blocking, timeout)
+        try:
+            hash(key)
+        except TypeError:
+            # Some configuration value cannot be compared, do not share
+            key = None
+        with self._lock:
+            client = self._clients.get(key) if key is not None else None
+            if client is None:
+                client = provider_class(**config)
+                if blocking:
+                    _use_blocking_pool(client, config.get('max_connections'),
+                                       timeout)
+                if key is not None:
+                    self._clients[key] = client
+            return client
+
+    def reset(self):
+        """Drop connections inherited from a parent process."""
+        # The lock may have been held by another thread at fork() time
+        self._lock = Lock()
+        for client in self._clients.values():
+            client.connection_pool.reset()
+
+    def clear(self):
+        """Disconnect and forget every shared client."""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for client in clients.values():
+            client.connection_pool.disconnect()
+
+
+CLIENTS = ClientRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    # Older Pythons rely on redis-py pools checking their pid on checkout
+    os.register_at_fork(after_in_child=CLIENTS.reset)
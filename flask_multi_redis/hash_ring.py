@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis hash_ring module."""
+
+from bisect import bisect
+from hashlib import md5
+
+
+def _hash(key):
+    if not isinstance(key, bytes):
+        key = str(key).encode('utf-8')
+    return int(md5(key).hexdigest()[:16], 16)
+
+
+class HashRing(object):
+
+    """Consistent hash ring mapping keys to their owning nodes."""
+
+    def __init__(self, nodes, vnodes=160, replicas=1):
+        """Initialize HashRing."""
+        self.nodes = list(nodes)
+        self.replicas = max(1, min(replicas, len(self.nodes)))
+        ring = []
+        for index, node in enumerate(self.nodes):
+            for vnode in range(vnodes):
+                point = '{0}#{1}'.format(node.name, vnode)
+                ring.append((_hash(point), index))
+        ring.sort()
+        self._hashes = [point for point, _ in ring]
+        self._indexes = [index for _, index in ring]
+
+    def get_indexes(self, key):
+        """Return indexes of the nodes owning key, primary first."""
+        if not self._hashes:
+            return []
+        owners = []
+        position = bisect(self._hashes, _hash(key))
+        for offset in range(len(self._indexes)):
+            index = self._indexes[(position + offset) % len(self._indexes)]
+            if index not in owners:
+                owners.append(index)
+                if len(owners) == self.replicas:
+                    break
+        return owners
+
+    def get_nodes(self, key):
+        """Return the nodes owning key, primary first."""
+        return [self.nodes[index] for index in self.get_indexes(key)]
+
+    def get_node(self, key):
+        """Return the primary node owning key."""
+        nodes = self.get_nodes(key)
+        if nodes:
+            return nodes[0]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis health module."""
+
+from os import getpid
+from threading import Event, Lock, Thread
+from time import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker(object):
+
+    """Track consecutive failures of a node and stop sending it traffic.
+
+    After failure_threshold consecutive failures the circuit opens. Once
+    reset_timeout is elapsed, the circuit becomes half-open and the next
+    probe decides if it closes again or stays open.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=10, on_open=None):
+        """Initialize CircuitBreaker."""
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_open = on_open
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = Lock()
+
+    def available(self):
+        """Tell if regular traffic may be sent to the node."""
+        return self.state == CLOSED
+
+    def record_success(self):
+        """Close the circuit after a successful command."""
+        if self.failures or self.state != CLOSED:
+            with self._lock:
+                self.failures = 0
+                self.state = CLOSED
+                self.opened_at = None
+
+    def record_failure(self):
+        """Count a failed command, opening the circuit when needed."""
+        with self._lock:
+            self.failures += 1
+            opening = self.state == HALF_OPEN or (
+                self.state == CLOSED and
+                self.failures >= self.failure_threshold
+            )
+            if opening or self.state == OPEN:
+                self.state = OPEN
+                self.opened_at = time()
+        if opening and self.on_open is not None:
+            self.on_open()
+
+    def should_probe(self):
+        """Switch to half-open once reset_timeout is elapsed."""
+        with self._lock:
+            if self.state == OPEN and \
+                    time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            return self.state == HALF_OPEN
+
+
+class HealthChecker(object):
+
+    """Probe nodes whose circuit is open until they recover.
+
+    The probing thread only runs while at least one circuit is not closed.
+    """
+
+    def __init__(self, redis_nodes, interval=1):
+        """Initialize HealthChecker."""
+        self._redis_nodes = redis_nodes
+        self.interval = interval
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Start probing thread if it is not running yet."""
+        with self._lock:
+            if self._thread is not None and self._pid == getpid():
+                return
+            self._stop.clear()
+            self._thread = Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = getpid()
+
+    def stop(self):
+        """Stop probing thread."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and self._pid == getpid():
+            thread.join()
+
+    def probe(self):
+        """Ping nodes due for a probe, return False if all are healthy."""
+        pending = False
+        for node in self._redis_nodes:
+            if node.circuit.state == CLOSED:
+                continue
+            pending = True
+            if node.circuit.should_probe():
+                try:
+                    node._redis_client.ping()
+                except Exception:  # pylint: disable=broad-except
+                    node.circuit.record_failure()
+                else:
+                    node.circuit.record_success()
+        return pending
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.interval)
+            if self._stop.is_set() or self.probe():
+                continue
+            with self._lock:
+                # A circuit may have opened since probe() looked at it
+                if all(node.circuit.state == CLOSED
+                       for node in self._redis_nodes):
+                    self._thread = None
+                    return
+        self._thread = None
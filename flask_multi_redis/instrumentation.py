@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis instrumentation module."""
+
+from bisect import bisect_left
+from threading import Lock
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10)
+FANOUT_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _escape(value):
+    """Escape a Prometheus label value."""
+    value = '{0}'.format(value)
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n',
+                                                                   '\\n')
+
+
+def _labels(**labels):
+    pairs = ['{0}="{1}"'.format(key, _escape(labels[key]))
+             for key in sorted(labels)]
+    return '{' + ','.join(pairs) + '}'
+
+
+class Histogram(object):
+
+    """Count observed values in fixed buckets."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Initialize Histogram."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        """Record value in its bucket."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Return (upper bound, count of values below it) pairs."""
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+    def snapshot(self):
+        """Return count, sum and cumulative buckets as a dictionary."""
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': self.cumulative()
+        }
+
+
+class Instrumentation(object):
+
+    """Collect per-node, per-command latencies and failures.
+
+    Nodes report every client command they run and the aggregator reports
+    fan-out width, jobs timing out and results arriving too late to be
+    used. Hooks are called with (event, node, command, value) on every
+    record, event being one of 'command', 'error', 'timeout', 'late' or
+    'fanout'.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """Initialize Instrumentation."""
+        self.buckets = tuple(buckets)
+        self.fanout = Histogram(FANOUT_BUCKETS)
+        self._commands = {}
+        self._hooks = []
+        self._lock = Lock()
+
+    def add_hook(self, hook):
+        """Call hook(event, node, command, value) on every record."""
+        self._hooks.append(hook)
+
+    def _notify(self, event, node, command, value):
+        for hook in self._hooks:
+            try:
+                hook(event, node, command, value)
+            except Exception:  # pylint: disable=broad-except
+                # A broken hook must not break Redis commands
+                pass
+
+    def _command(self, node, command):
+        key = (node, command)
+        if key not in self._commands:
+            self._commands[key] = {
+                'latency': Histogram(self.buckets),
+                'errors': 0,
+                'timeouts': 0,
+                'late': 0
+            }
+        return self._commands[key]
+
+    def record(self, node, command, latency, error=False):
+        """Record a command run on node, taking latency seconds."""
+        with self._lock:
+            entry = self._command(node, command)
+            entry['latency'].observe(latency)
+            if error:
+                entry['errors'] += 1
+        self._notify('command', node, command, latency)
+        if error:
+            self._notify('error', node, command, 1)
+
+    def record_timeout(self, node, command):
+        """Record a command left unanswered past the node timeout."""
+        with self._lock:
+            self._command(node, command)['timeouts'] += 1
+        self._notify('timeout', node, command, 1)
+
+    def record_late(self, node, command):
+        """Record a result discarded because it came after the timeout."""
+        with self._lock:
+            self._command(node, command)['late'] += 1
+        self._notify('late', node, command, 1)
+
+    def record_fanout(self, width):
+        """Record an aggregated call sent to width nodes."""
+        with self._lock:
+            self.fanout.observe(width)
+        self._notify('fanout', None, None, width)
+
+    def snapshot(self):
+        """Return recorded statistics per node and command."""
+        nodes = {}
+        with self._lock:
+            for (node, command), entry in self._commands.items():
+                stats = entry['latency'].snapshot()
+                stats['errors'] = entry['errors']
+                stats['timeouts'] = entry['timeouts']
+                stats['late'] = entry['late']
+                nodes.setdefault(node, {})[command] = stats
+            fanout = self.fanout.snapshot()
+        return {'nodes': nodes, 'fanout': fanout}
+
+    def render_prometheus(self, prefix='flask_multi_redis'):
+        """Render statistics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        commands = []
+        for node in sorted(snapshot['nodes']):
+            for command in sorted(snapshot['nodes'][node]):
+                commands.append((node, command,
+                                 snapshot['nodes'][node][command]))
+        lines = []
+        name = '{0}_command_duration_seconds'.format(prefix)
+        lines.append('# TYPE {0} histogram'.format(name))
+        for node, command, stats in commands:
+            for bound, count in stats['buckets']:
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{0}_bucket{1} {2}'.format(
+                    name, _labels(node=node, command=command, le=le), count
+                ))
+            labels = _labels(node=node, command=command)
+            lines.append('{0}_sum{1} {2!r}'.format(name, labels,
+                                                   stats['sum']))
+            lines.append('{0}_count{1} {2}'.format(name, labels,
+                                                  stats['count']))
+        for counter in ('errors', 'timeouts', 'late'):
+            name = '{0}_command_{1}_total'.format(prefix, counter)
+            lines.append('# TYPE {0} counter'.format(name))
+            for node, command, stats in commands:
+                lines.append('{0}{1} {2}'.format(
+                    name, _labels(node=node, command=command), stats[counter]
+                ))
+        name = '{0}_fanout_width'.format(prefix)
+        lines.append('# TYPE {0} histogram'.format(name))
+        for bound, count in snapshot['fanout']['buckets']:
+            le = '+Inf' if bound == float('inf') else '{0}'.format(bound)
+            lines.append('{0}_bucket{1} {2}'.format(name, _labels(le=le),
+                                                    count))
+        lines.append('{0}_sum {1}'.format(name, snapshot['fanout']['sum']))
+        lines.append('{0}_count {1}'.format(name,
+                                            snapshot['fanout']['count']))
+        return '\n'.join(lines) + '\n'
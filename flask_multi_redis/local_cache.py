@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis local_cache module."""
+
+from collections import OrderedDict
+from os import getpid
+from sys import getsizeof
+from threading import Event, Lock, Thread
+from time import time
+
+MISSING = object()
+
+
+def _sizeof(value):
+    try:
+        return len(value)
+    except TypeError:
+        return getsizeof(value)
+
+
+class LocalCache(object):
+
+    """Process-local LRU cache whose entries expire.
+
+    The cache holds at most max_entries entries and, when max_bytes is set,
+    at most max_bytes bytes of values. Entries live for ttl seconds, or for
+    the Redis TTL of the key if it is shorter.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None, ttl=60):
+        """Initialize LocalCache."""
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """Return cached value of key, or MISSING."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[1] < time():
+                if entry is not None:
+                    self.size -= entry[2]
+                self.misses += 1
+                return MISSING
+            # Reinsert the entry to mark it as the most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Cache value of key, for at most ttl seconds if given."""
+        if value is None:
+            return
+        if ttl is not None and ttl > 0:
+            ttl = min(ttl, self.ttl)
+        else:
+            ttl = self.ttl
+        size = _sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[2]
+            self._entries[key] = (value, time() + ttl, size)
+            self.size += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and
+                    self.size > self.max_bytes):
+                _, entry = self._entries.popitem(last=False)
+                self.size -= entry[2]
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop key from the cache."""
+        keys = [key]
+        if isinstance(key, bytes):
+            keys.append(key.decode('utf-8', 'replace'))
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.size -= entry[2]
+                    self.invalidations += 1
+
+    def clearing(self, method):
+        """Wrap method so that every entry is dropped after it runs."""
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.clear()
+        wrapper.__name__ = getattr(method, '__name__', 'wrapper')
+        return wrapper
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return cache counters as a dictionary."""
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+class CacheInvalidator(object):
+
+    """Drop LocalCache entries when their keys change on Redis nodes.
+
+    With the 'keyspace' mode, keyspace notifications are used. They must be
+    enabled on the servers (notify-keyspace-events KA). With the 'tracking'
+    mode, server assisted client side caching (CLIENT TRACKING BCAST) is
+    used, which requires Redis 6 or later. The whole cache is dropped when
+    a node connection is lost, or when listeners start again in a forked
+    child, since changes may have been missed.
+    """
+
+    MODES = ('keyspace', 'tracking')
+
+    def __init__(self, cache, redis_nodes, mode='keyspace', retry=1):
+        """Initialize CacheInvalidator."""
+        assert mode in self.MODES
+        self._cache = cache
+        self._redis_nodes = redis_nodes
+        self.mode = mode
+        self.retry = retry
+        self._lock = Lock()
+        self._stop = Event()
+        self._threads = []
+        self._pid = None
+
+    def start(self):
+        """Start a listening thread per node if they are not running yet."""
+        with self._lock:
+            if self._pid == getpid():
+                return
+            if self._pid is not None:
+                # Threads do not survive a fork, entries may be stale
+                self._cache.clear()
+            self._stop.clear()
+            self._threads = []
+            for node in self._redis_nodes:
+                thread = Thread(target=self._run, args=(node,))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._pid = getpid()
+
+    def stop(self):
+        """Stop listening threads."""
+        self._stop.set()
+        if self._pid == getpid():
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+        self._pid = None
+
+    def _run(self, node):
+        listen = getattr(self, '_listen_{0}'.format(self.mode))
+        while not self._stop.is_set():
+            try:
+                listen(node)
+            except Exception:  # pylint: disable=broad-except
+                self._cache.clear()
+                self._stop.wait(self.retry)
+
+    def _listen_keyspace(self, node):
+        pubsub = node._redis_client.pubsub(ignore_subscribe_messages=True)
+        prefix = '__keyspace@{0}__:'.format(node.config['db'])
+        pubsub.psubscribe(prefix + '*')
+        try:
+            while not self._stop.is_set():
+                message = pubsub.get_message(timeout=1)
+                if message is not None:
+                    channel = message['channel']
+                    self._cache.invalidate(channel[len(prefix):])
+        finally:
+            pubsub.close()
+
+    def _listen_tracking(self, node):
+        pool = node._redis_client.connection_pool
+        listener = pool.make_connection()
+        tracker = pool.make_connection()
+        try:
+            listener.send_command('CLIENT', 'ID')
+            client_id = listener.read_response()
+            listener.send_command('SUBSCRIBE', '__redis__:invalidate')
+            listener.read_response()
+            tracker.send_command('CLIENT', 'TRACKING', 'ON',
+                                 'REDIRECT', client_id, 'BCAST')
+            tracker.read_response()
+            while not self._stop.is_set():
+                if not listener.can_read(timeout=1):
+                    continue
+                message = listener.read_response()
+                if message[2] is None:
+                    self._cache.clear()
+                    continue
+                for key in message[2]:
+                    self._cache.invalidate(key)
+        finally:
+            listener.disconnect()
+            tracker.disconnect()
@@ -2,7 +2,9 @@
 
 """flask-multi-redis main module."""
 
-from random import randint
+from atexit import register
+from os import getpid
+from weakref import ref
 
 try:
     import redis
@@ -10,8 +12,28 @@ except ImportError:
     # We can allow custom provider only usage without redis-py being installed
     redis = None
 
-from flask_multi_redis.aggregator import Aggregator
+from flask_multi_redis.aggregator import READ_STRATEGIES, Aggregator
+from flask_multi_redis.balancer import BALANCERS
+from flask_multi_redis.batcher import Batcher
+from flask_multi_redis.health import HealthChecker
+from flask_multi_redis.instrumentation import Instrumentation
+from flask_multi_redis.local_cache import MISSING, CacheInvalidator, LocalCache
 from flask_multi_redis.redis_node import RedisNode
+from flask_multi_redis.repair import AntiEntropy
+from flask_multi_redis.replicator import Replicator
+from flask_multi_redis.request_cache import READS, RequestCache
+from flask_multi_redis.scripts import Script
+from flask_multi_redis.serialization import Codec
+from flask_multi_redis.sharder import Sharder
+from flask_multi_redis.worker_pool import WorkerPool
+from flask_multi_redis.write_behind import WriteBehind
+
+
+def _close_at_exit(reference):
+    """Close a FlaskMultiRedis instance, if it is still alive."""
+    instance = reference()
+    if instance is not None:
+        instance.close()
 
 
 class FlaskMultiRedis(object):
@@ -19,18 +41,41 @@ class FlaskMultiRedis(object):
     """Main Class for FlaskMultiRedis."""
 
     def __init__(self, app=None, strict=True,
-                 config_prefix='REDIS', strategy='loadbalancing', **kwargs):
+                 config_prefix='REDIS', strategy='loadbalancing',
+                 read_strategy='all', quorum=None, balancer='random',
+                 **kwargs):
         """Initialize FlaskMultiRedis."""
-        assert strategy in ['loadbalancing', 'aggregate']
+        assert strategy in ['loadbalancing', 'aggregate', 'sharding',
+                            'replicated']
+        assert read_strategy in READ_STRATEGIES
+        if balancer in BALANCERS:
+            balancer = BALANCERS[balancer]()
+        assert hasattr(balancer, 'pick')
         self._app = None
         self._redis_nodes = []
         self._strategy = strategy
+        self._read_strategy = read_strategy
+        self._quorum = quorum
+        self._balancer = balancer
         self._aggregator = None
+        self._pool = None
+        self._health_checker = None
+        self._local_cache = None
+        self._cache_invalidator = None
+        self._write_behind = None
+        self._anti_entropy = None
+        self._request_cache = None
+        self._pid = None
+        self.codec = None
+        self.instrumentation = None
+        self.scripts = {}
         self.provider_class = None
         if redis:
             self.provider_class = redis.StrictRedis if strict else redis.Redis
         self.provider_kwargs = kwargs
         self.config_prefix = config_prefix
+        # A weak reference lets instances dropped by app factories be freed
+        register(_close_at_exit, ref(self))
 
         if app is not None:
             self.init_app(app)
@@ -51,6 +96,13 @@ class FlaskMultiRedis(object):
 
     def init_app(self, app, **kwargs):
         """Initialize Flask app and parse configuration."""
+        if self._app is not None:
+            # Stop the threads started by the previous initialization
+            self.close()
+            self._pool = None
+            self._write_behind = None
+            self._anti_entropy = None
+            self._cache_invalidator = None
         self._app = app
         self.provider_kwargs.update(kwargs)
 
@@ -69,6 +121,34 @@ class FlaskMultiRedis(object):
         redis_default_ssl = app.config.get(
             '{0}_DEFAULT_SSL'.format(self.config_prefix), None
         )
+        redis_default_max_connections = app.config.get(
+            '{0}_DEFAULT_MAX_CONNECTIONS'.format(self.config_prefix), None
+        )
+        redis_default_blocking_pool = app.config.get(
+            '{0}_DEFAULT_BLOCKING_POOL'.format(self.config_prefix), False
+        )
+        redis_default_pool_timeout = app.config.get(
+            '{0}_DEFAULT_POOL_TIMEOUT'.format(self.config_prefix), 20
+        )
+        redis_default_socket_keepalive = app.config.get(
+            '{0}_DEFAULT_SOCKET_KEEPALIVE'.format(self.config_prefix), False
+        )
+        redis_default_health_check_interval = app.config.get(
+            '{0}_DEFAULT_HEALTH_CHECK_INTERVAL'.format(self.config_prefix), 0
+        )
+
+        redis_circuit_failure_threshold = app.config.get(
+            '{0}_CIRCUIT_FAILURE_THRESHOLD'.format(self.config_prefix), 3
+        )
+        redis_circuit_reset_timeout = app.config.get(
+            '{0}_CIRCUIT_RESET_TIMEOUT'.format(self.config_prefix), 10
+        )
+        redis_health_check_interval = app.config.get(
+            '{0}_HEALTH_CHECK_INTERVAL'.format(self.config_prefix), 1
+        )
+        redis_instrumentation = app.config.get(
+            '{0}_INSTRUMENTATION'.format(self.config_prefix), False
+        )
 
         redis_nodes = app.config.get(
             '{0}_NODES'.format(self.config_prefix), [
@@ -83,56 +163,407 @@ class FlaskMultiRedis(object):
             'db': redis_default_db,
             'password': redis_default_password,
             'socket_timeout': redis_default_socket_timeout,
-            'ssl': redis_default_ssl
+            'ssl': redis_default_ssl,
+            'max_connections': redis_default_max_connections,
+            'blocking_pool': redis_default_blocking_pool,
+            'pool_timeout': redis_default_pool_timeout,
+            'socket_keepalive': redis_default_socket_keepalive,
+            'health_check_interval': redis_default_health_check_interval
+        }
+
+        self._health_checker = HealthChecker(self._redis_nodes,
+                                             redis_health_check_interval)
+        circuit_conf = {
+            'failure_threshold': redis_circuit_failure_threshold,
+            'reset_timeout': redis_circuit_reset_timeout,
+            'on_open': self._health_checker.start
         }
 
+        if redis_instrumentation:
+            self.instrumentation = Instrumentation()
+
         for redis_node in redis_nodes:
             conf = {
                 'node': redis_node,
-                'default': default_conf
+                'default': default_conf,
+                'circuit': circuit_conf,
+                'instrumentation': self.instrumentation
             }
             nod = RedisNode(self.provider_class, conf, **self.provider_kwargs)
             self._redis_nodes.append(nod)
 
         if self._strategy == 'aggregate':
-            self._aggregator = Aggregator(self._redis_nodes)
+            self._init_aggregator(app)
+        elif self._strategy == 'sharding':
+            self._init_sharder(app)
+        elif self._strategy == 'replicated':
+            self._init_replicator(app)
+        if self._strategy in ['aggregate', 'replicated']:
+            self._init_repair(app)
+        if self._aggregator is not None:
+            self._aggregator.instrumentation = self.instrumentation
+        self._init_local_cache(app)
+        self._init_codec(app)
+        redis_request_cache = app.config.get(
+            '{0}_REQUEST_CACHE'.format(self.config_prefix), False
+        )
+        if redis_request_cache:
+            self._request_cache = RequestCache()
+
+        self._pid = getpid()
 
         if not hasattr(app, 'extensions'):
             app.extensions = {}
         app.extensions['redis'] = self
 
+    def _init_local_cache(self, app):
+        redis_local_cache_max_entries = app.config.get(
+            '{0}_LOCAL_CACHE_MAX_ENTRIES'.format(self.config_prefix), 0
+        )
+        redis_local_cache_max_bytes = app.config.get(
+            '{0}_LOCAL_CACHE_MAX_BYTES'.format(self.config_prefix), None
+        )
+        redis_local_cache_ttl = app.config.get(
+            '{0}_LOCAL_CACHE_TTL'.format(self.config_prefix), 60
+        )
+        redis_local_cache_invalidation = app.config.get(
+            '{0}_LOCAL_CACHE_INVALIDATION'.format(self.config_prefix), None
+        )
+        if not redis_local_cache_max_entries:
+            return
+        self._local_cache = LocalCache(redis_local_cache_max_entries,
+                                       redis_local_cache_max_bytes,
+                                       redis_local_cache_ttl)
+        if redis_local_cache_invalidation:
+            self._cache_invalidator = CacheInvalidator(
+                self._local_cache, self._redis_nodes,
+                redis_local_cache_invalidation
+            )
+            self._cache_invalidator.start()
+
+    def _init_codec(self, app):
+        redis_serializer = app.config.get(
+            '{0}_SERIALIZER'.format(self.config_prefix), None
+        )
+        redis_compression = app.config.get(
+            '{0}_COMPRESSION'.format(self.config_prefix), None
+        )
+        redis_compression_threshold = app.config.get(
+            '{0}_COMPRESSION_THRESHOLD'.format(self.config_prefix), 1024
+        )
+        redis_compression_level = app.config.get(
+            '{0}_COMPRESSION_LEVEL'.format(self.config_prefix), None
+        )
+        if redis_serializer is None and redis_compression is None:
+            return
+        self.codec = Codec(redis_serializer, redis_compression,
+                           redis_compression_threshold,
+                           redis_compression_level)
+
+    def _init_pool(self, app):
+        redis_aggregate_workers = app.config.get(
+            '{0}_AGGREGATE_WORKERS'.format(self.config_prefix), None
+        )
+        if redis_aggregate_workers is None:
+            redis_aggregate_workers = 4 * len(self._redis_nodes)
+        self._pool = WorkerPool(redis_aggregate_workers)
+
+    def _init_aggregator(self, app):
+        redis_write_behind = app.config.get(
+            '{0}_WRITE_BEHIND'.format(self.config_prefix), False
+        )
+        redis_write_behind_max_pending = app.config.get(
+            '{0}_WRITE_BEHIND_MAX_PENDING'.format(self.config_prefix), 10000
+        )
+        redis_write_behind_batch_size = app.config.get(
+            '{0}_WRITE_BEHIND_BATCH_SIZE'.format(self.config_prefix), 100
+        )
+        redis_write_behind_block_timeout = app.config.get(
+            '{0}_WRITE_BEHIND_BLOCK_TIMEOUT'.format(self.config_prefix), 0.1
+        )
+        redis_write_behind_retries = app.config.get(
+            '{0}_WRITE_BEHIND_RETRIES'.format(self.config_prefix), 2
+        )
+        redis_batch_window = app.config.get(
+            '{0}_BATCH_WINDOW'.format(self.config_prefix), 0
+        )
+        redis_batch_max_keys = app.config.get(
+            '{0}_BATCH_MAX_KEYS'.format(self.config_prefix), 64
+        )
+        self._init_pool(app)
+        self._aggregator = Aggregator(self._redis_nodes, self._pool,
+                                      self._read_strategy, self._quorum)
+        if redis_batch_window:
+            self._aggregator.batcher = Batcher(self._aggregator.mget,
+                                               redis_batch_window,
+                                               redis_batch_max_keys)
+        if redis_write_behind:
+            self._write_behind = WriteBehind(
+                self._aggregator, redis_write_behind_max_pending,
+                redis_write_behind_batch_size,
+                redis_write_behind_block_timeout, redis_write_behind_retries
+            )
+            self._aggregator.write_behind = self._write_behind
+
+    def _init_sharder(self, app):
+        redis_sharding_replicas = app.config.get(
+            '{0}_SHARDING_REPLICAS'.format(self.config_prefix), 1
+        )
+        redis_sharding_vnodes = app.config.get(
+            '{0}_SHARDING_VIRTUAL_NODES'.format(self.config_prefix), 160
+        )
+        self._init_pool(app)
+        # Sharder is an Aggregator routing keys to their owners only
+        self._aggregator = Sharder(self._redis_nodes, self._pool,
+                                   redis_sharding_replicas,
+                                   redis_sharding_vnodes)
+
+    def _init_replicator(self, app):
+        redis_zone = app.config.get(
+            '{0}_ZONE'.format(self.config_prefix), None
+        )
+        self._init_pool(app)
+        # Replicator is an Aggregator reading from a single node
+        self._aggregator = Replicator(self._redis_nodes, self._pool,
+                                      redis_zone)
+
+    def _init_repair(self, app):
+        redis_read_repair = app.config.get(
+            '{0}_READ_REPAIR'.format(self.config_prefix), False
+        )
+        redis_anti_entropy_interval = app.config.get(
+            '{0}_ANTI_ENTROPY_INTERVAL'.format(self.config_prefix), None
+        )
+        redis_anti_entropy_batch_size = app.config.get(
+            '{0}_ANTI_ENTROPY_BATCH_SIZE'.format(self.config_prefix), 100
+        )
+        redis_anti_entropy_rate = app.config.get(
+            '{0}_ANTI_ENTROPY_RATE'.format(self.config_prefix), 1000
+        )
+        self._aggregator.read_repair = redis_read_repair
+        if redis_anti_entropy_interval:
+            self._anti_entropy = AntiEntropy(
+                self._aggregator, redis_anti_entropy_interval,
+                redis_anti_entropy_batch_size, redis_anti_entropy_rate
+            )
+            self._anti_entropy.start()
+
+    def close(self):
+        """Stop background threads once pending commands are done."""
+        if self._write_behind is not None:
+            self._write_behind.close()
+        if self._anti_entropy is not None:
+            self._anti_entropy.stop()
+        if self._pool is not None:
+            self._pool.shutdown()
+        if self._health_checker is not None:
+            self._health_checker.stop()
+        if self._cache_invalidator is not None:
+            self._cache_invalidator.stop()
+
+    def warm_up(self, connections=1, timeout=None):
+        """Open connections to every node in parallel.
+
+        Nodes are otherwise connected to on first use. Return whether each
+        node, by name, could be warmed up within timeout seconds.
+        """
+        pool = WorkerPool()
+        tasks = [(node.name, pool.submit(node.warm_up, connections))
+                 for node in self._redis_nodes]
+        results = {}
+        for name, task in tasks:
+            results[name] = task.wait(timeout) and task.exception is None
+        return results
+
+    def register_script(self, name, source, policy='first_non_null'):
+        """Register a Lua script under name and return it."""
+        self.scripts[name] = Script(source, policy)
+        return self.scripts[name]
+
+    def run_script(self, name, keys=(), args=()):
+        """Run a registered script with EVALSHA.
+
+        In aggregate mode, the script runs on every node and replies are
+        merged with the script policy. In sharding mode, it runs on the
+        owners of its first key. Scripts may write any key, so cached
+        values are dropped.
+        """
+        if len(self._redis_nodes) == 0:
+            return None
+        script = self.scripts[name]
+        try:
+            if self._aggregator is not None:
+                return self._aggregator.run_script(script, keys, args)
+            else:
+                return script.run(self._pick_node(), keys, args)
+        finally:
+            if self._local_cache is not None:
+                self._local_cache.clear()
+            if self._request_cache is not None:
+                self._request_cache.clear()
+
+    def _available_nodes(self):
+        """Return nodes whose circuit is closed, or every node if none is."""
+        nodes = [node for node in self._redis_nodes
+                 if node.circuit.available()]
+        # Every node looks down, keep trying them all
+        return nodes or self._redis_nodes
+
+    def _pick_node(self):
+        """Pick a node with the balancer, skipping open circuits."""
+        return self._balancer.pick(self._available_nodes())
+
+    def flush(self, timeout=None):
+        """Wait until queued write-behind writes are sent."""
+        if self._write_behind is not None:
+            return self._write_behind.flush(timeout)
+        return True
+
+    def write_behind_stats(self):
+        """Return write-behind counters, or None if it is disabled."""
+        if self._write_behind is not None:
+            return self._write_behind.stats()
+
+    def batch_stats(self):
+        """Return read batching counters, or None if it is disabled."""
+        if self._aggregator is not None and \
+                self._aggregator.batcher is not None:
+            return self._aggregator.batcher.stats()
+
+    def repair_stats(self):
+        """Return anti-entropy counters, or None if it is disabled."""
+        if self._anti_entropy is not None:
+            return self._anti_entropy.stats()
+
+    def request_cache_stats(self):
+        """Return request cache counters, or None if it is disabled."""
+        if self._request_cache is not None:
+            return self._request_cache.stats()
+
+    def cache_stats(self):
+        """Return local cache counters, or None if it is disabled."""
+        if self._local_cache is not None:
+            return self._local_cache.stats()
+
+    def instrumentation_stats(self):
+        """Return latency histograms per node and command, or None."""
+        if self.instrumentation is not None:
+            return self.instrumentation.snapshot()
+
+    def node_stats(self):
+        """Return requests, errors, latency and circuit state per node."""
+        stats = {}
+        for node in self._redis_nodes:
+            stats[node.name] = node.stats.snapshot()
+            stats[node.name]['weight'] = node.weight
+            stats[node.name]['circuit'] = node.circuit.state
+        return stats
+
+    def _check_fork(self):
+        """Start background threads again in a forked child.
+
+        Under a preforking server, extensions are often initialized in the
+        master process, whose threads are not inherited by workers.
+        """
+        if self._pid != getpid():
+            for service in [self._cache_invalidator, self._anti_entropy]:
+                if service is not None:
+                    service.start()
+            self._pid = getpid()
+
     def __getattr__(self, name):
         if len(self._redis_nodes) == 0:
             return None
-        if self._strategy == 'aggregate':
-            return getattr(self._aggregator, name)
+        self._check_fork()
+        if self._aggregator is not None:
+            attribute = getattr(self._aggregator, name)
         else:
-            rnd = randint(0, len(self._redis_nodes) - 1)
-            return getattr(self._redis_nodes[rnd], name)
+            attribute = getattr(self._pick_node(), name)
+        if self._local_cache is None and self._request_cache is None or \
+                name in READS or not callable(attribute):
+            return attribute
+        if name == 'pipeline':
+            return self._clearing_pipeline(attribute)
+        return self._clearing(attribute)
+
+    def _clearing(self, method):
+        """Wrap method so that cached values are dropped after it runs."""
+        # Keys written by other commands are not known, forget them all
+        for cache in [self._local_cache, self._request_cache]:
+            if cache is not None:
+                method = cache.clearing(method)
+        return method
+
+    def _clearing_pipeline(self, pipeline):
+        """Wrap pipeline so that cached values are dropped on execute."""
+        def wrapper(*args, **kwargs):
+            pipe = pipeline(*args, **kwargs)
+            pipe.execute = self._clearing(pipe.execute)
+            return pipe
+        wrapper.__name__ = 'pipeline'
+        return wrapper
 
     def __getitem__(self, name):
         if len(self._redis_nodes) == 0:
             return None
-        if self._strategy == 'aggregate':
-            return self._aggregator.get(name)
+        self._check_fork()
+        if self._request_cache is not None:
+            return self._request_cache.get(name, self._get)
+        return self._get(name)
+
+    def _get(self, name):
+        if self._local_cache is not None:
+            # Payloads are cached, so that callers never share a decoded object
+            value = self._local_cache.get(name)
+            if value is MISSING:
+                ttl, value = self._get_with_ttl(name)
+                self._local_cache.set(name, value, ttl)
+            return self._decode(value)
+        if self._aggregator is not None:
+            return self._decode(self._aggregator.get(name))
+        else:
+            return self._decode(self._pick_node().get(name))
+
+    def _decode(self, value):
+        if self.codec is None or value is None:
+            return value
+        return self.codec.decode(value)
+
+    def _get_with_ttl(self, name):
+        if self._aggregator is not None:
+            return self._aggregator.get_with_ttl(name)
         else:
-            rnd = randint(0, len(self._redis_nodes) - 1)
-            return self._redis_nodes[rnd].get(name)
+            return None, self._pick_node().get(name)
 
     def __setitem__(self, name, value):
         if len(self._redis_nodes) == 0:
             return
-        if self._strategy == 'aggregate':
-            return self._aggregator.set(name, value)
-        else:
-            rnd = randint(0, len(self._redis_nodes) - 1)
-            return self._redis_nodes[rnd].set(name, value)
+        self._check_fork()
+        if self.codec is not None:
+            value = self.codec.encode(value)
+        try:
+            if self._aggregator is not None:
+                return self._aggregator.set(name, value)
+            else:
+                return self._pick_node().set(name, value)
+        finally:
+            if self._local_cache is not None:
+                self._local_cache.invalidate(name)
+            if self._request_cache is not None:
+                self._request_cache.invalidate(name)
 
     def __delitem__(self, name):
         if len(self._redis_nodes) == 0:
             return
-        if self._strategy == 'aggregate':
-            return self._aggregator.delete(name)
-        else:
-            for node in self._redis_nodes:
-                node.delete(name)
+        self._check_fork()
+        try:
+            if self._aggregator is not None:
+                return self._aggregator.delete(name)
+            else:
+                for node in self._available_nodes():
+                    node.delete(name)
+        finally:
+            if self._local_cache is not None:
+                self._local_cache.invalidate(name)
+            if self._request_cache is not None:
+                self._request_cache.invalidate(name)
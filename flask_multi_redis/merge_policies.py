@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis merge_policies module."""
+
+from heapq import merge
+from itertools import groupby
+
+
+def _newest(results):
+    """Return the (ttl, value) pair with the highest TTL."""
+    results = [x for x in results if x[1]]
+    if results:
+        results.sort(key=lambda t: t[0])
+        return results[-1]
+    return None, None
+
+
+def first_non_null(replies):
+    """Return the first reply which is not None."""
+    for reply in replies:
+        if reply is not None:
+            return reply
+
+
+def max_ttl(replies):
+    """Return the non-empty value with the highest TTL.
+
+    Replies are (ttl, value) pairs, the TTL of the key being fetched along
+    with the command.
+    """
+    return _newest(replies)[1]
+
+
+def total(replies):
+    """Return the sum of integer replies."""
+    return sum([x for x in replies if isinstance(x, (int, float))])
+
+
+def maximum(replies):
+    """Return the highest reply."""
+    replies = [x for x in replies if x is not None]
+    if replies:
+        return max(replies)
+
+
+def minimum(replies):
+    """Return the lowest reply."""
+    replies = [x for x in replies if x is not None]
+    if replies:
+        return min(replies)
+
+
+def union(replies):
+    """Return members found on any node."""
+    members = set()
+    for reply in replies:
+        members.update(reply or ())
+    return members
+
+
+def intersection(replies):
+    """Return members found on every node."""
+    replies = [set(reply or ()) for reply in replies]
+    if not replies:
+        return set()
+    return replies[0].intersection(*replies[1:])
+
+
+def sorted_merge(replies):
+    """Return sorted members of every reply, each one once."""
+    return [member for member, _ in
+            groupby(merge(*[sorted(reply or ()) for reply in replies]))]
+
+
+def all_equal(replies):
+    """Tell whether every node sent back the same reply."""
+    return all(reply == replies[0] for reply in replies[1:])
+
+
+POLICIES = {
+    'first_non_null': first_non_null,
+    'max_ttl': max_ttl,
+    'sum': total,
+    'max': maximum,
+    'min': minimum,
+    'union': union,
+    'intersection': intersection,
+    'sorted_merge': sorted_merge,
+    'all_equal': all_equal
+}
+
+COMMANDS = {
+    # Reads of a whole key return the copy expiring last, as get does
+    'get': 'max_ttl',
+    'getrange': 'max_ttl',
+    'hget': 'max_ttl',
+    'hgetall': 'max_ttl',
+    'hmget': 'max_ttl',
+    'hvals': 'max_ttl',
+    'lindex': 'max_ttl',
+    'lrange': 'max_ttl',
+    'zrange': 'max_ttl',
+    'zrangebyscore': 'max_ttl',
+    'zrevrange': 'max_ttl',
+    'zscore': 'first_non_null',
+    'type': 'first_non_null',
+    'echo': 'first_non_null',
+    # Membership and existence hold if they hold on any node
+    'exists': 'max',
+    'hexists': 'max',
+    'sismember': 'max',
+    'ttl': 'max',
+    'pttl': 'max',
+    # Sizes are those of the largest copy
+    'strlen': 'max',
+    'hlen': 'max',
+    'llen': 'max',
+    'scard': 'max',
+    'zcard': 'max',
+    'dbsize': 'max',
+    'smembers': 'union',
+    'sunion': 'union',
+    'sinter': 'intersection',
+    'hkeys': 'sorted_merge',
+    # Counters keep the most advanced node value
+    'incr': 'max',
+    'incrby': 'max',
+    'incrbyfloat': 'max',
+    'hincrby': 'max',
+    'hincrbyfloat': 'max',
+    'decr': 'min',
+    'decrby': 'min',
+    # Removals count what every node removed, as delete does
+    'delete': 'sum',
+    'unlink': 'sum',
+    'hdel': 'sum',
+    'srem': 'sum',
+    'zrem': 'sum',
+    # Other writes tell whether nodes agreed, as set does
+    'set': 'all_equal',
+    'mset': 'all_equal',
+    'setex': 'all_equal',
+    'expire': 'all_equal',
+    'pexpire': 'all_equal',
+    'persist': 'all_equal',
+    'hset': 'all_equal',
+    'hmset': 'all_equal',
+    'sadd': 'all_equal',
+    'zadd': 'all_equal',
+    'lpush': 'all_equal',
+    'rpush': 'all_equal',
+    'ping': 'all_equal'
+}
+
+
+# Commands only reading data, which may be answered by a single node
+READ_COMMANDS = frozenset([
+    'get', 'getrange', 'hget', 'hgetall', 'hmget', 'hvals', 'lindex',
+    'lrange', 'zrange', 'zrangebyscore', 'zrevrange', 'zscore', 'type',
+    'echo', 'exists', 'hexists', 'sismember', 'ttl', 'pttl', 'strlen',
+    'hlen', 'llen', 'scard', 'zcard', 'dbsize', 'smembers', 'sunion', 'sinter',
+    'hkeys'
+])
+
+
+def resolve(policy):
+    """Return the merge function of a policy name or callable."""
+    if callable(policy):
+        return policy
+    return POLICIES[policy]
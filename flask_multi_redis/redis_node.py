@@ -2,20 +2,155 @@
 
 """flask-multi-redis redis_node module."""
 
+from socket import error as socket_error
+from socket import timeout as socket_timeout
+from sys import version_info
+from threading import Lock
+from time import time
+
+try:
+    from redis.exceptions import ConnectionError as RedisConnectionError
+    from redis.exceptions import TimeoutError as RedisTimeoutError
+    NODE_ERRORS = (RedisConnectionError, RedisTimeoutError, socket_error)
+    TIMEOUT_ERRORS = (RedisTimeoutError, socket_timeout)
+except ImportError:
+    NODE_ERRORS = (socket_error,)
+    TIMEOUT_ERRORS = (socket_timeout,)
+
+from flask_multi_redis.balancer import NodeStats
+from flask_multi_redis.connection_pool import CLIENTS
+from flask_multi_redis.health import CircuitBreaker
+
+if version_info >= (3, 6):
+    from inspect import isawaitable
+    from flask_multi_redis.async_tracking import track_awaitable
+else:
+    track_awaitable = None
+
+
+class TrackedMethod(object):
+
+    """Call a client method, reporting its outcome to the node.
+
+    Coroutines are reported once awaited.
+    """
+
+    def __init__(self, node, method, name=None):
+        """Initialize TrackedMethod."""
+        self._node = node
+        self._method = method
+        self.__self__ = getattr(method, '__self__', None)
+        self.__name__ = name or getattr(method, '__name__', None)
+
+    def __call__(self, *args, **kwargs):
+        error = None
+        pending = False
+        start = self.begin()
+        try:
+            result = self._method(*args, **kwargs)
+            if track_awaitable is not None and isawaitable(result):
+                pending = True
+                return track_awaitable(self, start, result)
+            return result
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            if not pending:
+                self.end(start, error)
+
+    def begin(self):
+        """Report a call start to the node, return its start time."""
+        self._node.stats.begin()
+        return time()
+
+    def end(self, start, error=None):
+        """Report the outcome of a call started at start to the node."""
+        latency = time() - start
+        failed = isinstance(error, NODE_ERRORS)
+        self._node.stats.end(latency, failed)
+        if failed:
+            self._node.circuit.record_failure()
+        else:
+            self._node.circuit.record_success()
+        instrumentation = self._node.instrumentation
+        if instrumentation is not None:
+            self._instrument(instrumentation, latency, error)
+
+    def _instrument(self, instrumentation, latency, error):
+        instrumentation.record(self._node.name, self.__name__, latency,
+                               error is not None)
+        if isinstance(error, TIMEOUT_ERRORS):
+            instrumentation.record_timeout(self._node.name, self.__name__)
+
+
+class TrackedPipeline(TrackedMethod):
+
+    """Create a client pipeline, reporting its execution to the node."""
+
+    def __call__(self, *args, **kwargs):
+        pipe = self._method(*args, **kwargs)
+        # Commands are sent by execute, creating the pipeline costs nothing
+        pipe.execute = TrackedMethod(self._node, pipe.execute, 'pipeline')
+        return pipe
+
 
 class RedisNode(object):
 
-    """Define a Redis node and its configuration."""
+    """Define a Redis node and its configuration.
+
+    The client is only created on first use. Client methods are wrapped
+    once and then stored on the node, so later calls skip __getattr__.
+    """
 
     def __init__(self, provider_class, config, **kwargs):
         """Initialize RedisNode."""
         self.config = {}
+        self.pool_config = {}
         self._ssl = None
+        self._client = None
+        self._client_lock = Lock()
         self.provider_class = provider_class
         self._parse_conf(config)
         self._parse_ssl_conf(config)
         self.config.update(kwargs)
-        self._redis_client = self.provider_class(**self.config)
+        self.circuit = CircuitBreaker(**config.get('circuit', {}))
+        self.stats = NodeStats()
+        self.instrumentation = config.get('instrumentation')
+
+    @property
+    def _redis_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = CLIENTS.get(self.provider_class,
+                                               self.config, self.pool_config)
+        return self._client
+
+    @_redis_client.setter
+    def _redis_client(self, client):
+        # Methods wrapped so far belong to the previous client
+        for name, value in list(self.__dict__.items()):
+            if isinstance(value, TrackedMethod):
+                del self.__dict__[name]
+        self._client = client
+
+    def warm_up(self, connections=1):
+        """Create the client and open connections ahead of time."""
+        pool = getattr(self._redis_client, 'connection_pool', None)
+        if pool is None:
+            return
+        opened = []
+        try:
+            for _ in range(connections):
+                try:
+                    opened.append(pool.get_connection())
+                except TypeError:
+                    # redis-py before 5.3 requires a command name
+                    opened.append(pool.get_connection('PING'))
+        finally:
+            for connection in opened:
+                pool.release(connection)
 
     def _parse_conf(self, config):
         assert 'host' in config['node']
@@ -26,6 +161,18 @@ class RedisNode(object):
 
             if element in config['node']:
                 self.config[element] = config['node'][element]
+        for element in ['max_connections', 'blocking_pool', 'pool_timeout',
+                        'socket_keepalive', 'health_check_interval']:
+            if element in config['node']:
+                self.pool_config[element] = config['node'][element]
+            elif config['default'].get(element) is not None:
+                self.pool_config[element] = config['default'][element]
+
+        self.name = config['node'].get('name', '{0}:{1}/{2}'.format(
+            self.config['host'], self.config['port'], self.config['db']
+        ))
+        self.weight = config['node'].get('weight', 1)
+        self.zone = config['node'].get('zone')
 
     def _parse_ssl_conf(self, config):
         self.config['ssl'] = False
@@ -42,4 +189,13 @@ class RedisNode(object):
             self.config.update(self._ssl)
 
     def __getattr__(self, name):
-        return getattr(self._redis_client, name)
+        if name.startswith('__'):
+            # Do not create the client for copy, pickle and the like
+            raise AttributeError(name)
+        attribute = getattr(self._redis_client, name)
+        if callable(attribute):
+            tracked_class = TrackedPipeline if name == 'pipeline' \
+                else TrackedMethod
+            attribute = tracked_class(self, attribute)
+            self.__dict__[name] = attribute
+        return attribute
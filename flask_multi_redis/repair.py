@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis repair module."""
+
+from os import getpid
+from threading import Event, Lock, Thread
+from time import time
+
+
+def lags(answer, winner, tolerance=2):
+    """Tell whether a node (ttl, value) answer lags behind winner.
+
+    TTLs are read at slightly different times on each node, so they are
+    only compared within tolerance seconds.
+    """
+    ttl, value = answer
+    winner_ttl, winner_value = winner
+    if value != winner_value:
+        return True
+    if (ttl < 0) != (winner_ttl < 0):
+        return True
+    return abs(ttl - winner_ttl) > tolerance
+
+
+def _ttl_rank(answer):
+    """Rank (ttl, value) answers, a key without expiry lasting longest."""
+    return float('inf') if answer[0] < 0 else answer[0]
+
+
+def authority(answers):
+    """Return the (ttl, value) answer other copies may be repaired from.
+
+    TTLs do not tell which write came last, so a value only overrides
+    another one when a strict majority of answers hold it. Missing keys
+    are repaired from the only value found, and copies of the same value
+    get the longest TTL. Return None when no value may be trusted.
+    """
+    counts = {}
+    for _, value in answers:
+        if value is not None:
+            counts[value] = counts.get(value, 0) + 1
+    if len(counts) > 1:
+        counts = dict((value, count) for value, count in counts.items()
+                      if count * 2 > len(answers))
+    if len(counts) != 1:
+        return None
+    value = list(counts)[0]
+    return max([answer for answer in answers if answer[1] == value],
+               key=_ttl_rank)
+
+
+def repair(node, name, seen, winner):
+    """Write the winning (ttl, value) of name back to node.
+
+    The write is made in a WATCH/MULTI transaction and skipped if name no
+    longer holds the seen value, so that a concurrent write always wins.
+    Return whether the node was repaired.
+    """
+    ttl, value = winner
+    pipe = node.pipeline(transaction=True)
+    try:
+        pipe.watch(name)
+        if pipe.get(name) != seen:
+            return False
+        pipe.multi()
+        if ttl > 0:
+            pipe.set(name, value, ex=ttl)
+        else:
+            pipe.set(name, value)
+        pipe.execute()
+        return True
+    finally:
+        pipe.reset()
+
+
+def _fetch(node, keys):
+    """Fetch (ttl, value) pairs of keys in a single round trip."""
+    pipe = node.pipeline(transaction=False)
+    for key in keys:
+        pipe.get(key)
+        pipe.ttl(key)
+    replies = pipe.execute(raise_on_error=False)
+    answers = []
+    for value, ttl in zip(replies[::2], replies[1::2]):
+        if isinstance(value, Exception) or isinstance(ttl, Exception):
+            # Not a string key, GET does not apply
+            answers.append(None)
+        else:
+            answers.append((ttl or 1, value))
+    return answers
+
+
+class AntiEntropy(object):
+
+    """Reconcile aggregated nodes in the background.
+
+    Every interval seconds, the keyspace of every node is walked with SCAN.
+    Values and TTLs of batch_size keys at a time are fetched from every
+    node in one round trip, and nodes lagging behind the copy with the
+    highest TTL are repaired. At most rate keys are checked per second.
+    """
+
+    def __init__(self, aggregator, interval=60, batch_size=100, rate=1000,
+                 match=None):
+        """Initialize AntiEntropy."""
+        self._aggregator = aggregator
+        self.interval = interval
+        self.batch_size = batch_size
+        self.rate = rate
+        self.match = match
+        self.scanned = 0
+        self.repaired = 0
+        self.passes = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """Start the reconciling thread if it is not running yet."""
+        with self._lock:
+            # Threads do not survive a fork, start a new one in the child
+            if self._pid == getpid():
+                return
+            self._stop.clear()
+            self._thread = Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+            self._pid = getpid()
+
+    def stop(self):
+        """Stop the reconciling thread."""
+        self._stop.set()
+        if self._thread is not None and self._pid == getpid():
+            self._thread.join()
+        self._thread = None
+        self._pid = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:  # pylint: disable=broad-except
+                # Nodes may be down, try again on next pass
+                pass
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """Walk the whole keyspace once."""
+        batch = []
+        for key in self._aggregator.scan_iter(match=self.match,
+                                              count=self.batch_size):
+            batch.append(key)
+            if len(batch) >= self.batch_size:
+                self.reconcile(batch)
+                batch = []
+            if self._stop.is_set():
+                return
+        if batch:
+            self.reconcile(batch)
+        self.passes += 1
+
+    def reconcile(self, keys):
+        """Repair lagging copies of keys, then wait to honour rate."""
+        start = time()
+        results = self._aggregator._runner(_fetch, keys)
+        for index, key in enumerate(keys):
+            answers = [(node, answers[index]) for node, answers in results
+                       if answers[index] is not None]
+            winner = authority([answer for _, answer in answers])
+            if winner is None:
+                continue
+            for node, answer in answers:
+                if lags(answer, winner):
+                    try:
+                        if repair(node, key, answer[1], winner):
+                            self.repaired += 1
+                    except Exception:  # pylint: disable=broad-except
+                        # A concurrent write won or the node failed
+                        pass
+        self.scanned += len(keys)
+        if self.rate:
+            self._stop.wait(max(len(keys) / float(self.rate) -
+                                (time() - start), 0))
+
+    def stats(self):
+        """Return anti-entropy counters as a dictionary."""
+        return {
+            'passes': self.passes,
+            'scanned': self.scanned,
+            'repaired': self.repaired
+        }
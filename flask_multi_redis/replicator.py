@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis replicator module."""
+
+from random import shuffle
+
+from flask_multi_redis.aggregator import Aggregator, _get_with_ttl, \
+    _list_or_args
+from flask_multi_redis.repair import repair
+
+
+class Replicator(Aggregator):
+
+    """Write to every node and read from the nearest one.
+
+    Writes are aggregated as in aggregate mode. Reads go to a single node:
+    nodes whose circuit is closed come first, then nodes in the local zone,
+    then the fastest ones by average latency. Other nodes are only read on
+    a miss or an error. With read_repair set, nodes which missed a key found
+    on another node are sent its value and TTL in the background.
+    """
+
+    def __init__(self, redis_nodes, pool=None, zone=None):
+        """Initialize Replicator."""
+        super(Replicator, self).__init__(redis_nodes, pool)
+        self.zone = zone
+
+    def _read_order(self):
+        """Return nodes in the order reads should try them."""
+        nodes = list(self._redis_nodes)
+        # Spread reads among nodes ranking the same
+        shuffle(nodes)
+
+        def rank(node):
+            circuit = getattr(node, 'circuit', None)
+            stats = getattr(node, 'stats', None)
+            latency = getattr(stats, 'latency', None)
+            return (
+                circuit is not None and not circuit.available(),
+                self.zone is not None and
+                getattr(node, 'zone', None) != self.zone,
+                # Nodes never used yet have no latency and get tried first
+                latency or 0
+            )
+        return sorted(nodes, key=rank)
+
+    def _read(self, target, *args, **kwargs):
+        """Return the first non-empty target(node, ...) result.
+
+        The last empty result is returned if no node has a value, and the
+        last error is raised if every node failed.
+        """
+        error = None
+        answered = False
+        result = None
+        for node in self._read_order():
+            try:
+                result = target(node, *args, **kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                error = exc
+                continue
+            if result:
+                return result
+            answered = True
+        if not answered and error is not None:
+            raise error
+        return result
+
+    def get(self, name):
+        """Replicated get method."""
+        if self.read_repair:
+            return self.get_with_ttl(name)[1]
+        return self._read(lambda node: node.get(name))
+
+    def get_with_ttl(self, name):
+        """Replicated get method, returning a (ttl, value) pair."""
+        missed = []
+
+        def _answer(node):
+            ttl, value = _get_with_ttl(node, name)
+            if value:
+                return ttl, value
+            if value is None:
+                missed.append(node)
+        winner = self._read(_answer) or (None, None)
+        if self.read_repair and winner[1]:
+            for node in missed:
+                self._pool.submit(repair, node, name, None, winner)
+        return winner
+
+    def mget(self, keys, *args):
+        """Replicated mget method, reading missing keys from other nodes."""
+        keys = _list_or_args(keys, args)
+        values = [None] * len(keys)
+        pending = list(range(len(keys)))
+        error = None
+        answered = False
+        for node in self._read_order():
+            try:
+                result = node.mget([keys[i] for i in pending])
+            except Exception as exc:  # pylint: disable=broad-except
+                error = exc
+                continue
+            answered = True
+            missing = []
+            for index, value in zip(pending, result):
+                values[index] = value
+                if value is None:
+                    missing.append(index)
+            pending = missing
+            if not pending:
+                break
+        if not answered and error is not None:
+            raise error
+        return values
+
+    def _command(self, name):
+        if name not in self.read_commands:
+            return super(Replicator, self)._command(name)
+
+        def command(*args, **kwargs):
+            return self._read(
+                lambda node: getattr(node, name)(*args, **kwargs)
+            )
+        command.__name__ = name
+        return command
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis request_cache module."""
+
+from threading import Event, Lock
+
+from flask import g, has_app_context
+
+from flask_multi_redis.merge_policies import READ_COMMANDS
+
+# Methods only reading data, which leave memoized values valid
+READS = READ_COMMANDS | frozenset([
+    'mget', 'keys', 'iter_keys', 'scan', 'scan_iter', 'get_with_ttl'
+])
+
+
+class _Call(object):
+
+    """Backend call shared by every thread asking for the same key."""
+
+    def __init__(self):
+        """Initialize _Call."""
+        self.done = Event()
+        self.result = None
+        self.exception = None
+
+
+class SingleFlight(object):
+
+    """Merge concurrent identical calls into a single one.
+
+    The first thread asking for a key runs the call, threads asking for the
+    same key meanwhile wait for its result, or its exception.
+    """
+
+    def __init__(self):
+        """Initialize SingleFlight."""
+        self.calls = 0
+        self.merged = 0
+        self._calls = {}
+        self._lock = Lock()
+
+    def do(self, key, function, *args):
+        """Return function(*args), sharing the call with other threads."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.merged += 1
+        if not leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return call.result
+        try:
+            call.result = function(*args)
+        except Exception as exc:
+            call.exception = exc
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def forget(self, key=None):
+        """Make later calls for key, or any key, start a new call."""
+        with self._lock:
+            if key is None:
+                self._calls.clear()
+            else:
+                self._calls.pop(key, None)
+
+
+class RequestCache(object):
+
+    """Memoize reads for the lifetime of the Flask app context.
+
+    Values are kept in flask.g, so that they are dropped once the request
+    ends. Reads of a key not memoized yet, from any thread, are merged into
+    a single backend call. Outside of an app context, reads are only merged.
+    """
+
+    def __init__(self):
+        """Initialize RequestCache."""
+        self.hits = 0
+        self._attribute = '_multi_redis_memo_{0}'.format(id(self))
+        self._flight = SingleFlight()
+
+    def _memo(self):
+        """Return the memo of the current app context, or None."""
+        if not has_app_context():
+            return None
+        memo = getattr(g, self._attribute, None)
+        if memo is None:
+            memo = {}
+            setattr(g, self._attribute, memo)
+        return memo
+
+    def get(self, key, function):
+        """Return the memoized value of key, or function(key)."""
+        memo = self._memo()
+        if memo is not None and key in memo:
+            self.hits += 1
+            return memo[key]
+        value = self._flight.do(key, function, key)
+        if memo is not None:
+            memo[key] = value
+        return value
+
+    def invalidate(self, key):
+        """Drop the memoized value of key."""
+        # Reads started before the write must not be joined anymore
+        self._flight.forget(key)
+        memo = self._memo()
+        if memo is not None:
+            memo.pop(key, None)
+
+    def clear(self):
+        """Drop every memoized value."""
+        self._flight.forget()
+        memo = self._memo()
+        if memo is not None:
+            memo.clear()
+
+    def clearing(self, method):
+        """Wrap method so that memoized values are dropped after it runs."""
+        def wrapper(*args, **kwargs):
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.clear()
+        wrapper.__name__ = getattr(method, '__name__', 'wrapper')
+        return wrapper
+
+    def stats(self):
+        """Return request cache counters as a dictionary."""
+        return {
+            'hits': self.hits,
+            'calls': self._flight.calls,
+            'merged': self._flight.merged
+        }
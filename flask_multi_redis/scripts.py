@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis scripts module."""
+
+from hashlib import sha1
+from weakref import WeakKeyDictionary
+
+from flask_multi_redis.merge_policies import resolve
+
+try:
+    from redis.exceptions import NoScriptError
+except ImportError:
+    # We can allow custom provider only usage without redis-py being installed
+    NoScriptError = None
+
+
+def _is_noscript(exc):
+    """Tell whether exc means the script is not cached on the server."""
+    if NoScriptError is not None and isinstance(exc, NoScriptError):
+        return True
+    return str(exc).startswith('NOSCRIPT')
+
+
+class Script(object):
+
+    """Lua script loaded once per node and run with EVALSHA.
+
+    The script is loaded with SCRIPT LOAD the first time it runs on a node,
+    and loaded again if the node answers NOSCRIPT, after a restart or a
+    SCRIPT FLUSH. Replies of several nodes are merged with policy, a name
+    from merge_policies.POLICIES or a function taking the list of replies.
+    """
+
+    def __init__(self, source, policy='first_non_null'):
+        """Initialize Script."""
+        # TTLs of script results cannot be fetched along with them
+        assert policy != 'max_ttl'
+        self.source = source
+        self.sha = sha1(source.encode('utf-8')).hexdigest()
+        self.policy = policy
+        self.merge = resolve(policy)
+        self._loaded = WeakKeyDictionary()
+
+    def load(self, node):
+        """Load the script on node."""
+        node.script_load(self.source)
+        self._loaded[node] = True
+
+    def run(self, node, keys=(), args=()):
+        """Run the script on node."""
+        keys = list(keys)
+        if node not in self._loaded:
+            self.load(node)
+        try:
+            return node.evalsha(self.sha, len(keys), *(keys + list(args)))
+        except Exception as exc:  # pylint: disable=broad-except
+            if not _is_noscript(exc):
+                raise
+        self.load(node)
+        return node.evalsha(self.sha, len(keys), *(keys + list(args)))
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis serialization module."""
+
+import json
+import pickle
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack is only needed to use the msgpack serializer
+    msgpack = None
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    # lz4 is only needed to use the lz4 compression
+    lz4 = None
+
+try:
+    import zstandard as zstd
+except ImportError:
+    # zstandard is only needed to use the zstd compression
+    zstd = None
+
+# Never valid UTF-8 nor the start of a JSON or pickle payload. It is the
+# msgpack encoding of -2, so values without a valid header after it are
+# returned as is
+MAGIC = b'\xfe'
+
+
+def _json_dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+def _pickle_dumps(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if not isinstance(value, type(u'')):
+        # Numbers are stored as text, as redis-py does
+        value = repr(value) if isinstance(value, float) else str(value)
+    return value.encode('utf-8')
+
+
+def _zlib_compress(data, level):
+    return zlib.compress(data, -1 if level is None else level)
+
+
+def _lz4_compress(data, level):
+    return lz4.compress(data, compression_level=level or 0)
+
+
+def _zstd_compress(data, level):
+    return zstd.ZstdCompressor(level=level or 3).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstd.ZstdDecompressor().decompress(data)
+
+
+# name: (format id, dumps, loads, available)
+SERIALIZERS = {
+    None: (0, _to_bytes, bytes, True),
+    'json': (1, _json_dumps, _json_loads, True),
+    'msgpack': (2, _msgpack_dumps, _msgpack_loads, msgpack is not None),
+    'pickle': (3, _pickle_dumps, pickle.loads, True)
+}
+
+# name: (format id, compress, decompress, available)
+COMPRESSIONS = {
+    None: (0, None, None, True),
+    'zlib': (1, _zlib_compress, zlib.decompress, True),
+    'lz4': (2, _lz4_compress, lz4 and lz4.decompress, lz4 is not None),
+    'zstd': (3, _zstd_compress, _zstd_decompress, zstd is not None)
+}
+
+
+def _by_id(table):
+    return dict((entry[0], (name,) + entry[1:])
+                for name, entry in table.items())
+
+
+class Codec(object):
+
+    """Serialize and compress values stored with item access.
+
+    Encoded values start with the MAGIC byte, then a format byte telling
+    the serializer (high nibble) and compression (low nibble) used, so that
+    values stored with other settings still decode. Only payloads of at
+    least threshold bytes are compressed. Values without a valid header,
+    such as values stored before a codec was set up, are returned as is.
+    Pickled values are only loaded by codecs using the pickle serializer,
+    since unpickling data from Redis may run arbitrary code.
+    """
+
+    def __init__(self, serializer='json', compression=None, threshold=1024,
+                 level=None):
+        """Initialize Codec."""
+        assert serializer in SERIALIZERS, \
+            'unknown serializer {0}'.format(serializer)
+        assert compression in COMPRESSIONS, \
+            'unknown compression {0}'.format(compression)
+        assert SERIALIZERS[serializer][3], \
+            '{0} is not installed'.format(serializer)
+        assert COMPRESSIONS[compression][3], \
+            '{0} is not installed'.format(compression)
+        self.serializer = serializer
+        self.compression = compression
+        self.threshold = threshold
+        self.level = level
+        self._serializers = _by_id(SERIALIZERS)
+        self._compressions = _by_id(COMPRESSIONS)
+
+    def encode(self, value):
+        """Return value as bytes, with a format header."""
+        serializer_id, dumps, _, _ = SERIALIZERS[self.serializer]
+        data = dumps(value)
+        compression_id, compress, _, _ = COMPRESSIONS[self.compression]
+        if compress is not None and len(data) >= self.threshold:
+            compressed = compress(data, self.level)
+            if len(compressed) < len(data):
+                data = compressed
+            else:
+                compression_id = 0
+        else:
+            compression_id = 0
+        header = bytearray([serializer_id << 4 | compression_id])
+        return MAGIC + bytes(header) + data
+
+    def decode(self, data):
+        """Return the value encoded in data, or data if it has no header."""
+        if not isinstance(data, bytes) or data[:1] != MAGIC or len(data) < 2:
+            return data
+        header = bytearray(data[1:2])[0]
+        serializer = self._serializers.get(header >> 4)
+        compression = self._compressions.get(header & 0x0f)
+        if serializer is None or compression is None or \
+                not serializer[3] or not compression[3]:
+            return data
+        if serializer[0] == 'pickle' and self.serializer != 'pickle':
+            return data
+        payload = data[2:]
+        try:
+            if compression[2] is not None:
+                payload = compression[2](payload)
+            return serializer[2](payload)
+        except Exception:  # pylint: disable=broad-except
+            # Not a value encoded by a codec after all
+            return data
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis sharder module."""
+
+from flask_multi_redis.aggregator import (AggregatedPipeline, Aggregator,
+                                          _list_or_args)
+from flask_multi_redis.hash_ring import HashRing
+from flask_multi_redis.merge_policies import resolve
+
+# Multi-key commands split per shard: name -> (merge policy, is a write)
+SPLIT_COMMANDS = {
+    'delete': ('sum', True),
+    'unlink': ('sum', True),
+    'touch': ('sum', True),
+    'exists': ('sum', False),
+    'sunion': ('union', False),
+    'sinter': ('intersection', False)
+}
+
+# Commands whose keys may live on several shards and cannot be split
+CROSS_SHARD_COMMANDS = frozenset([
+    'sdiff', 'sdiffstore', 'sinterstore', 'sunionstore', 'smove',
+    'zunionstore', 'zinterstore', 'rename', 'renamenx', 'rpoplpush',
+    'brpoplpush', 'lmove', 'blmove', 'msetnx', 'pfcount', 'pfmerge',
+    'bitop', 'blpop', 'brpop', 'copy'
+])
+
+# Commands without keys, sent to every node: name -> merge policy
+KEYLESS_COMMANDS = {
+    'ping': 'all_equal',
+    'dbsize': 'sum',
+    'flushdb': 'all_equal',
+    'flushall': 'all_equal',
+    'info': None
+}
+
+
+def _cross_shard(name):
+    message = '{0} is not implemented in sharding mode,'.format(name)
+    message += ' its keys may live on several shards.'
+    return NotImplementedError(message)
+
+
+class ShardedPipeline(AggregatedPipeline):
+
+    """Buffer commands and send them to their owners, one batch per node.
+
+    Multi-key commands are split per key. A key deleted on several of its
+    owners is counted once. Reads of multi-key commands go to primary owners.
+    """
+
+    def _nodes(self):
+        return self._aggregator.ring.nodes
+
+    def _parts(self, name, args, nodes):
+        ring = self._aggregator.ring
+        if name in SPLIT_COMMANDS:
+            write = SPLIT_COMMANDS[name][1]
+            return [(ring.get_indexes(key)[:None if write else 1], (key,))
+                    for key in _list_or_args(args[0], args[1:])]
+        if name == 'mset':
+            mapping = args[0]
+            return [(ring.get_indexes(key), ({key: mapping[key]},))
+                    for key in mapping]
+        return [(ring.get_indexes(args[0]), args)]
+
+    def _merge(self, name, parts):
+        if SPLIT_COMMANDS.get(name, (None,))[0] == 'sum':
+            return sum([max([x for x in part if isinstance(x, int)] or [0])
+                        for part in parts])
+        return super(ShardedPipeline, self)._merge(name, parts)
+
+
+class Sharder(Aggregator):
+
+    """Route Redis commands to the nodes owning their keys.
+
+    Keys are mapped to nodes with a consistent hash ring. Writes go to every
+    owner of a key, reads go to its primary owner and fall back to the other
+    owners on a miss or an error. Multi-key commands such as exists, unlink
+    or sunion send one batch per shard and merge the replies, while commands
+    which cannot be split raise NotImplementedError. Other commands are sent
+    to the owners of their first argument, reads to the primary one only.
+    Commands without keys run on every node, and are merged with the policy
+    registered for them.
+    """
+
+    def __init__(self, redis_nodes, pool=None, replicas=1, vnodes=160):
+        """Initialize Sharder."""
+        super(Sharder, self).__init__(redis_nodes, pool)
+        for name, (policy, _) in SPLIT_COMMANDS.items():
+            self.commands[name] = policy
+        for name in CROSS_SHARD_COMMANDS:
+            self.commands.pop(name, None)
+        for name, policy in KEYLESS_COMMANDS.items():
+            if policy is not None:
+                self.commands[name] = policy
+        self.replicas = replicas
+        self.vnodes = vnodes
+        self._ring = None
+        self._ring_source = None
+
+    @property
+    def ring(self):
+        """Consistent hash ring built from the current node list."""
+        nodes = self._redis_nodes
+        if self._ring_source is not nodes or \
+                len(self._ring.nodes) != len(nodes):
+            self._ring = HashRing(nodes, self.vnodes, self.replicas)
+            self._ring_source = nodes
+        return self._ring
+
+    def _group(self, keys, position=0):
+        """Map node indexes to the indexes of the keys they own."""
+        groups = {}
+        for key_index, key in enumerate(keys):
+            owners = self.ring.get_indexes(key)
+            if position < len(owners):
+                groups.setdefault(owners[position], []).append(key_index)
+        return groups
+
+    def get(self, name):
+        """Sharded get method."""
+        error = None
+        for node in self.ring.get_nodes(name):
+            try:
+                result = node.get(name)
+            except Exception as exc:  # pylint: disable=broad-except
+                error = exc
+                continue
+            if result:
+                return result
+            error = None
+        if error is not None:
+            raise error
+
+    def get_with_ttl(self, name):
+        """Sharded get method, TTL being left unknown."""
+        return None, self.get(name)
+
+    def set(self, name, value, **kwargs):
+        """Sharded set method."""
+        owners = self.ring.get_nodes(name)
+        if len(owners) == 1:
+            return owners[0].set(name, value, **kwargs)
+
+        def _set(node, value, **kwargs):
+            return node.set(name, value, **kwargs)
+        jobs = [(node, _set, (value,), kwargs) for node in owners]
+        results = [x for _, x in self._iter_jobs(jobs)]
+        return len(set(results)) <= 1
+
+    def mget(self, keys, *args):
+        """Sharded mget method, sending one MGET per owning node."""
+        keys = _list_or_args(keys, args)
+        nodes = self.ring.nodes
+        values = [None] * len(keys)
+        pending = list(range(len(keys)))
+
+        def _mget(node, keys):
+            return node.mget(keys)
+        for position in range(self.ring.replicas):
+            groups = self._group([keys[i] for i in pending], position)
+            groups = [(nodes[index], [pending[i] for i in group])
+                      for index, group in groups.items()]
+            jobs = [(node, _mget, ([keys[i] for i in group],), {})
+                    for node, group in groups]
+            pending = []
+            answered = set()
+            for job, result in self._iter_jobs(jobs):
+                answered.add(job)
+                for key_index, value in zip(groups[job][1], result):
+                    values[key_index] = value
+                    if value is None:
+                        pending.append(key_index)
+            for job, (_, group) in enumerate(groups):
+                if job not in answered:
+                    pending.extend(group)
+            if not pending:
+                break
+        return values
+
+    def mset(self, mapping):
+        """Sharded mset method, sending one MSET per owning node."""
+        keys = list(mapping)
+        groups = {}
+        for position in range(self.ring.replicas):
+            for index, group in self._group(keys, position).items():
+                groups.setdefault(index, []).extend(group)
+
+        def _mset(node, mapping):
+            return node.mset(mapping)
+        jobs = []
+        for index, group in groups.items():
+            owned = dict((keys[i], mapping[keys[i]]) for i in group)
+            jobs.append((self.ring.nodes[index], _mset, (owned,), {}))
+        results = [x for _, x in self._iter_jobs(jobs)]
+        return len(set(results)) <= 1
+
+    def _split(self, name, keys, write):
+        """Send a multi-key command to the owners of its keys.
+
+        Each node gets the keys it owns in one batch. Writes go to every
+        owner, reads to primary owners only. Return the replies of nodes
+        for the keys they are the primary owner of.
+        """
+        positions = range(self.ring.replicas) if write else [0]
+        groups = {}
+        for position in positions:
+            for index, group in self._group(keys, position).items():
+                primary, others = groups.setdefault(index, ([], []))
+                owned = primary if position == 0 else others
+                owned.extend([keys[i] for i in group])
+
+        def _call(node, primary, others):
+            if not others:
+                return getattr(node, name)(*primary)
+            pipe = node.pipeline(transaction=False)
+            if primary:
+                getattr(pipe, name)(*primary)
+            getattr(pipe, name)(*others)
+            replies = pipe.execute()
+            return replies[0] if primary else None
+        _call.__name__ = name
+        jobs = [(self.ring.nodes[index], _call, group, {})
+                for index, group in groups.items()]
+        return [x for _, x in self._iter_jobs(jobs) if x is not None]
+
+    def delete(self, *names):
+        """Sharded delete method, sending one batch per owning node."""
+        return resolve('sum')(self._split('delete', list(names), True))
+
+    def run_script(self, script, keys=(), args=()):
+        """Run a Script on the owners of its first key.
+
+        Scripts without keys run on every node.
+        """
+        if not keys:
+            return super(Sharder, self).run_script(script, keys, args)
+
+        def _run_script(node, keys, args):
+            return script.run(node, keys, args)
+        jobs = [(node, _run_script, (keys, args), {})
+                for node in self.ring.get_nodes(keys[0])]
+        return script.merge([x for _, x in self._iter_jobs(jobs)])
+
+    def pipeline(self, transaction=True):
+        """Return a ShardedPipeline sending commands to their owners."""
+        return ShardedPipeline(self, transaction)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name == 'connection_pool':
+            return super(Sharder, self).__getattr__(name)
+
+        if name in CROSS_SHARD_COMMANDS:
+            raise _cross_shard(name)
+        if name in SPLIT_COMMANDS:
+            policy, write = SPLIT_COMMANDS[name]
+
+            def split(keys, *args):
+                return resolve(policy)(
+                    self._split(name, _list_or_args(keys, args), write)
+                )
+            return split
+
+        if name in KEYLESS_COMMANDS:
+            return super(Sharder, self).__getattr__(name)
+        if name in self.read_commands:
+            def command(key, *args, **kwargs):
+                return getattr(self.ring.get_node(key), name)(key, *args,
+                                                              **kwargs)
+            return command
+
+        def _write(node, key, *args, **kwargs):
+            return getattr(node, name)(key, *args, **kwargs)
+        _write.__name__ = name
+
+        def write(key, *args, **kwargs):
+            owners = self.ring.get_nodes(key)
+            if len(owners) == 1:
+                return _write(owners[0], key, *args, **kwargs)
+            jobs = [(node, _write, (key,) + args, kwargs) for node in owners]
+            # Reply of the first owner answering, the primary if it did
+            results = sorted(self._iter_jobs(jobs), key=lambda x: x[0])
+            if results:
+                return results[0][1]
+        return write
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis worker_pool module."""
+
+from os import getpid
+from sys import version_info
+from threading import Event, Lock, Thread
+from weakref import ref
+
+if version_info < (3,):
+    import Queue as queue
+else:
+    import queue
+
+# Weak references to running pools, kept alive so that their callbacks run
+_RUNNING = set()
+
+
+def _stopper(tasks, workers):
+    """Return a weakref callback stopping workers of a collected pool."""
+    def stop(reference):
+        _RUNNING.discard(reference)
+        for _ in range(workers):
+            tasks.put(None)
+    return stop
+
+
+class Task(object):
+
+    """Hold the outcome of a function submitted to a WorkerPool."""
+
+    def __init__(self, target, args, kwargs):
+        """Initialize Task."""
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs
+        self._done = Event()
+        self._lock = Lock()
+        self._callbacks = []
+        self.result = None
+        self.exception = None
+        self.cancelled = False
+        self.started = False
+
+    def run(self):
+        """Run the target function and store its outcome."""
+        if not self.cancelled:
+            self.started = True
+            try:
+                self.result = self._target(*self._args, **self._kwargs)
+            except Exception as exc:  # pylint: disable=broad-except
+                self.exception = exc
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def add_done_callback(self, callback):
+        """Call callback(task) once the task has finished running."""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def cancel(self):
+        """Prevent the target function from running if not started yet."""
+        self.cancelled = True
+
+    def done(self):
+        """Tell if the task has finished running."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait for the task to finish, return True if it did."""
+        self._done.wait(timeout)
+        return self._done.is_set()
+
+
+class WorkerPool(object):
+
+    """Long-lived pool of threads running aggregated commands.
+
+    Threads are started on first use. With ``workers`` set to 0, every
+    task runs in a freshly spawned thread, as Aggregator used to do.
+    Threads do not keep the pool alive, and stop once it is collected.
+    """
+
+    def __init__(self, workers=0):
+        """Initialize WorkerPool."""
+        self.workers = workers
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._lock = Lock()
+        self._pid = None
+        self._reference = None
+
+    def _start(self):
+        with self._lock:
+            # Threads do not survive a fork, start a new set in the child
+            if self._pid == getpid():
+                return
+            self._tasks = queue.Queue()
+            self._threads = []
+            for _ in range(self.workers):
+                thread = Thread(target=self._work, args=(self._tasks,))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            _RUNNING.discard(self._reference)
+            self._reference = ref(self, _stopper(self._tasks, self.workers))
+            _RUNNING.add(self._reference)
+            self._pid = getpid()
+
+    @staticmethod
+    def _work(tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task.run()
+
+    def submit(self, target, *args, **kwargs):
+        """Schedule target(*args, **kwargs) and return its Task."""
+        task = Task(target, args, kwargs)
+        if self.workers <= 0:
+            Thread(target=task.run).start()
+            return task
+        if self._pid != getpid():
+            self._start()
+        self._tasks.put(task)
+        return task
+
+    def shutdown(self, wait=True):
+        """Stop worker threads once queued tasks are processed."""
+        with self._lock:
+            if self._pid != getpid():
+                return
+            for _ in self._threads:
+                self._tasks.put(None)
+            if wait:
+                for thread in self._threads:
+                    thread.join()
+            self._threads = []
+            self._pid = None
+            _RUNNING.discard(self._reference)
+            self._reference = None
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""flask-multi-redis write_behind module."""
+
+from collections import OrderedDict
+from os import getpid
+from threading import Condition, Thread
+from time import time
+
+
+class WriteBehind(object):
+
+    """Queue aggregated writes and flush them from a background thread.
+
+    Writes are kept per key, so a key written several times before being
+    flushed is only sent once, with its last value. The flushing thread
+    sends up to batch_size writes to every node in a single pipeline per
+    node and retries nodes failing to answer. When max_pending keys are
+    waiting, writers block up to block_timeout seconds, then their write is
+    dropped.
+    """
+
+    def __init__(self, aggregator, max_pending=10000, batch_size=100,
+                 block_timeout=0.1, retries=2):
+        """Initialize WriteBehind."""
+        self._aggregator = aggregator
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.block_timeout = block_timeout
+        self.retries = retries
+        self.queued = 0
+        self.coalesced = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.failed = 0
+        self._pending = OrderedDict()
+        self._in_flight = 0
+        self._condition = Condition()
+        self._thread = None
+        self._pid = None
+        self._closing = False
+
+    def set(self, name, value, **kwargs):
+        """Queue a SET command, return False if it was dropped."""
+        return self._put(name, ('set', (name, value), kwargs))
+
+    def delete(self, *names):
+        """Queue DEL commands, return how many were queued."""
+        return len([name for name in names
+                    if self._put(name, ('delete', (name,), {}))])
+
+    def _put(self, key, command):
+        with self._condition:
+            if key in self._pending:
+                self._pending[key] = command
+                self.coalesced += 1
+                return True
+            deadline = time() + self.block_timeout
+            while len(self._pending) >= self.max_pending:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    self.dropped += 1
+                    return False
+                self._condition.wait(remaining)
+            self._pending[key] = command
+            self.queued += 1
+            if self._pid != getpid():
+                self._start()
+            self._condition.notify_all()
+            return True
+
+    def _start(self):
+        self._closing = False
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+        self._pid = getpid()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closing:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                batch = []
+                while self._pending and len(batch) < self.batch_size:
+                    batch.append(self._pending.popitem(last=False)[1])
+                self._in_flight += 1
+                self._condition.notify_all()
+            try:
+                self._flush_batch(batch)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    def _flush_batch(self, batch):
+        def _execute(node, batch):
+            pipe = node.pipeline(transaction=False)
+            for command, args, kwargs in batch:
+                getattr(pipe, command)(*args, **kwargs)
+            return pipe.execute()
+        nodes = list(self._aggregator._redis_nodes)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.retried += len(nodes)
+            jobs = [(node, _execute, (batch,), {}) for node in nodes]
+            answered = set(index for index, _ in
+                           self._aggregator._iter_jobs(jobs))
+            nodes = [node for index, node in enumerate(nodes)
+                     if index not in answered]
+            if not nodes:
+                break
+        self.failed += len(batch) * len(nodes)
+        self.flushed += len(batch)
+
+    def flush(self, timeout=None):
+        """Wait until queued writes are sent, return False on timeout."""
+        deadline = None if timeout is None else time() + timeout
+        with self._condition:
+            while self._pending or self._in_flight:
+                if self._pid != getpid():
+                    self._start()
+                remaining = None if deadline is None else deadline - time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self):
+        """Flush queued writes and stop the flushing thread."""
+        with self._condition:
+            self._closing = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None and self._pid == getpid():
+            thread.join()
+        self._pid = None
+
+    def stats(self):
+        """Return write-behind counters as a dictionary."""
+        return {
+            'pending': len(self._pending),
+            'queued': self.queued,
+            'coalesced': self.coalesced,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'retried': self.retried,
+            'failed': self.failed
+        }
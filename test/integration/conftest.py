@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""Pytest configuration for Flask-Multi-Redis integration tests."""
+
+from sys import version_info
+
+import flask
+from flask_multi_redis.health import CircuitBreaker
+from flask_multi_redis.main import FlaskMultiRedis
+import pytest
+from test.integration.fakes import MemoryNode, Pipeline
+
+collect_ignore = []
+if version_info < (3, 6):
+    # async and await are syntax errors on older interpreters
+    collect_ignore.append('test_async_flask_multi_redis.py')
+
+
+@pytest.fixture
+def app():
+    return flask.Flask(__name__)
+
+
+@pytest.fixture
+def loadbalanced(app):
+    return FlaskMultiRedis(app)
+
+
+@pytest.fixture
+def aggregated(app):
+    return FlaskMultiRedis(app, strategy='aggregate')
+
+
+@pytest.fixture
+def memory_nodes():
+    return [MemoryNode('node{0}'.format(i)) for i in range(1, 5)]
+
+
+@pytest.fixture
+def fake_node():
+    class Node(object):
+        def __init__(self, name):
+            self.config = {'socket_timeout': 2}
+            self.name = name
+            self.circuit = CircuitBreaker()
+
+        def pipeline(self, transaction=True):
+            return Pipeline(self)
+
+        def get(self, pattern):
+            if pattern == 'missing':
+                return None
+            return self.name
+
+        def ttl(self, pattern):
+            if int(self.name[-1]) == 3:
+                return None
+            return int(self.name[-1])
+
+        def keys(self, pattern):
+            if pattern == 'empty':
+                return []
+            if int(self.name[-1]) == 3:
+                return [self.name, pattern]
+            return [pattern]
+
+        def set(self, key, pattern):
+            setattr(self, key, pattern)
+            return True
+
+        def mset(self, mapping):
+            for key in mapping:
+                setattr(self, key, mapping[key])
+            return True
+
+        def delete(self, *names):
+            deleted = [name for name in names if hasattr(self, name)]
+            for name in deleted:
+                delattr(self, name)
+            return len(deleted)
+    return Node
+
+
+@pytest.fixture
+def mocked_loadbalanced(loadbalanced, fake_node):
+    loadbalanced._redis_nodes = [
+                                    fake_node('node1'),
+                                    fake_node('node2'),
+                                    fake_node('node3')
+                                ]
+    return loadbalanced
+
+
+@pytest.fixture
+def sharded(app, memory_nodes):
+    redis = FlaskMultiRedis(app, strategy='sharding')
+    redis._aggregator._redis_nodes = memory_nodes
+    return redis
+
+
+@pytest.fixture
+def memory_aggregated(aggregated, memory_nodes):
+    aggregated._aggregator._redis_nodes = memory_nodes
+    return aggregated
+
+
+@pytest.fixture
+def mocked_aggregated(aggregated, fake_node):
+    aggregated._aggregator._redis_nodes = [
+                                              fake_node('node1'),
+                                              fake_node('node2'),
+                                              fake_node('node3')
+                                          ]
+    return aggregated
+
+
+@pytest.fixture
+def balanced_app(app):
+    class NamedProvider(object):
+        def __init__(self, **kwargs):
+            self.host = kwargs['host']
+
+        def get(self, name):
+            return self.host
+
+    app.config['REDIS_NODES'] = [
+        {'host': 'local', 'weight': 9},
+        {'host': 'remote', 'weight': 1}
+    ]
+    app.provider = NamedProvider
+    return app
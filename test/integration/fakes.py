@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""Fake Redis nodes for Flask-Multi-Redis integration tests."""
+
+from fnmatch import fnmatch
+
+from flask_multi_redis.health import CircuitBreaker
+
+
+class Pipeline(object):
+    """Fake pipeline running buffered commands on a node when executed."""
+
+    def __init__(self, node):
+        self.node = node
+        self.commands = []
+        self.immediate = False
+
+    def watch(self, *names):
+        self.immediate = True
+
+    def multi(self):
+        self.immediate = False
+
+    def reset(self):
+        self.commands = []
+        self.immediate = False
+
+    def __getattr__(self, name):
+        if self.immediate:
+            return getattr(self.node, name)
+
+        def command(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return command
+
+    def execute(self, raise_on_error=True):
+        results = []
+        for name, args, kwargs in self.commands:
+            try:
+                results.append(getattr(self.node, name)(*args, **kwargs))
+            except Exception as exc:
+                if raise_on_error:
+                    raise
+                results.append(exc)
+        return results
+
+
+class MemoryNode(object):
+    """Fake Redis node keeping its data in memory."""
+
+    def __init__(self, name):
+        self.config = {'socket_timeout': 2}
+        self.name = name
+        self.circuit = CircuitBreaker()
+        self.data = {}
+        self.ttls = {}
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+    def get(self, name):
+        return self.data.get(name)
+
+    def ttl(self, name):
+        if name not in self.data:
+            return -2
+        return self.ttls.get(name, -1)
+
+    def set(self, name, value, ex=None):
+        self.data[name] = value
+        self.ttls.pop(name, None)
+        if ex is not None:
+            self.ttls[name] = ex
+        return True
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def mset(self, mapping):
+        self.data.update(mapping)
+        return True
+
+    def delete(self, *names):
+        deleted = [name for name in names if name in self.data]
+        for name in deleted:
+            del self.data[name]
+        return len(deleted)
+
+    unlink = delete
+
+    def exists(self, *names):
+        return len([name for name in names if name in self.data])
+
+    def touch(self, *names):
+        return self.exists(*names)
+
+    def expire(self, name, time):
+        if name not in self.data:
+            return False
+        self.ttls[name] = time
+        return True
+
+    def dbsize(self):
+        return len(self.data)
+
+    def ping(self):
+        return True
+
+    def sadd(self, name, *values):
+        members = self.data.setdefault(name, set())
+        added = set(values) - members
+        members.update(values)
+        return len(added)
+
+    def sunion(self, keys, *args):
+        return set().union(*[self.data.get(key, set())
+                             for key in [keys] + list(args)])
+
+    def sinter(self, keys, *args):
+        return set.intersection(*[set(self.data.get(key, set()))
+                                  for key in [keys] + list(args)])
+
+    def keys(self, pattern='*'):
+        return [key for key in self.data if fnmatch(key, pattern)]
+
+    def scan_iter(self, match=None, count=None):
+        return iter(self.keys(match or '*'))
+
+    def scan(self, cursor=0, match=None, count=None):
+        keys = sorted(self.keys(match or '*'))
+        count = count or 10
+        page = keys[cursor:cursor + count]
+        if cursor + count >= len(keys):
+            return 0, page
+        return cursor + count, page
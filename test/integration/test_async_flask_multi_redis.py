@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis asyncio flavour."""
+
+import asyncio
+from time import sleep
+
+import flask
+from flask_multi_redis.async_aggregator import AsyncAggregator
+from flask_multi_redis.async_main import AsyncFlaskMultiRedis
+import pytest
+from redis.asyncio import StrictRedis
+from redis.exceptions import ConnectionError
+
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+
+class FakeAsyncProvider(object):
+
+    """Async Redis provider storing data in memory, named after its host."""
+
+    def __init__(self, **kwargs):
+        self.name = kwargs['host']
+        self.data = {'pattern': self.name}
+        self.delay = 0
+
+    async def get(self, name):
+        await asyncio.sleep(self.delay)
+        return self.data.get(name)
+
+    async def ttl(self, name):
+        if self.name == 'node3':
+            return None
+        return int(self.name[-1])
+
+    async def keys(self, pattern):
+        return list(self.data)
+
+    async def set(self, name, value):
+        self.data[name] = value
+        return True
+
+    async def delete(self, name):
+        return 1 if self.data.pop(name, None) is not None else 0
+
+    async def scan(self, cursor=0, match=None, count=None):
+        await asyncio.sleep(self.delay)
+        keys = sorted(self.data)
+        count = count or 10
+        if cursor + count >= len(keys):
+            return 0, keys[cursor:]
+        return cursor + count, keys[cursor:cursor + count]
+
+
+@pytest.fixture
+def app():
+    app = flask.Flask(__name__)
+    app.config['REDIS_NODES'] = [
+        {'host': 'node1', 'socket_timeout': 1},
+        {'host': 'node2', 'socket_timeout': 1},
+        {'host': 'node3', 'socket_timeout': 1}
+    ]
+    return app
+
+
+@pytest.fixture
+def aggregated(app):
+    return AsyncFlaskMultiRedis.from_custom_provider(
+        FakeAsyncProvider, app, strategy='aggregate'
+    )
+
+
+@pytest.fixture
+def loadbalanced(app):
+    return AsyncFlaskMultiRedis.from_custom_provider(FakeAsyncProvider, app)
+
+
+def test_async_constructor():
+    """Test that AsyncFlaskMultiRedis uses redis.asyncio clients."""
+
+    redis = AsyncFlaskMultiRedis(flask.Flask(__name__))
+    assert isinstance(redis._redis_client, StrictRedis)
+    assert redis._pool is None
+
+
+def test_async_failures_reach_the_circuit(app):
+    """Test that coroutines are tracked once awaited, so that connection
+    errors open the circuit of their node."""
+
+    class DownProvider(FakeAsyncProvider):
+        async def get(self, name):
+            await asyncio.sleep(0.01)
+            raise ConnectionError()
+
+    app.config['REDIS_NODES'] = [{'host': 'down'}]
+    app.config['REDIS_CIRCUIT_FAILURE_THRESHOLD'] = 3
+    redis = AsyncFlaskMultiRedis.from_custom_provider(DownProvider, app)
+    node = redis._redis_nodes[0]
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            run(redis['key'])
+    stats = node.stats.snapshot()
+    assert stats['errors'] == 3
+    assert stats['latency'] >= 0.005
+    assert not node.circuit.available()
+    redis.close()
+
+
+def test_async_circuits_close_on_trial_requests(app):
+    """Test that open circuits of async nodes are not probed with pings
+    left unawaited, and close once a request succeeds again."""
+
+    class FlakyProvider(FakeAsyncProvider):
+        down = True
+
+        async def get(self, name):
+            if self.down:
+                raise ConnectionError()
+            return await super(FlakyProvider, self).get(name)
+
+        def ping(self):
+            raise AssertionError('async nodes are not probed')
+
+    app.config['REDIS_NODES'] = [{'host': 'flaky'}]
+    app.config['REDIS_CIRCUIT_FAILURE_THRESHOLD'] = 1
+    app.config['REDIS_CIRCUIT_RESET_TIMEOUT'] = 0.05
+    app.config['REDIS_HEALTH_CHECK_INTERVAL'] = 0.01
+    redis = AsyncFlaskMultiRedis.from_custom_provider(FlakyProvider, app)
+    node = redis._redis_nodes[0]
+    with pytest.raises(ConnectionError):
+        run(redis['key'])
+    assert not node.circuit.available()
+    FlakyProvider.down = False
+    sleep(0.06)
+    assert run(redis['pattern']) == 'flaky'
+    assert node.circuit.available()
+    redis.close()
+
+
+def test_async_unsupported_strategies(app):
+    """Test that strategies without asynchronous support are refused."""
+
+    for strategy in ['sharding', 'replicated']:
+        with pytest.raises(AssertionError):
+            AsyncFlaskMultiRedis(app, strategy=strategy)
+
+
+def test_async_unsupported_settings(app):
+    """Test that settings without asynchronous support are refused rather
+    than ignored."""
+
+    for name, value in [('REDIS_SERIALIZER', 'json'),
+                        ('REDIS_LOCAL_CACHE_MAX_ENTRIES', 10),
+                        ('REDIS_REQUEST_CACHE', True),
+                        ('REDIS_ANTI_ENTROPY_INTERVAL', 60)]:
+        app.config[name] = value
+        with pytest.raises(AssertionError) as error:
+            AsyncFlaskMultiRedis(app, strategy='aggregate')
+        assert name in str(error.value)
+        del app.config[name]
+    AsyncFlaskMultiRedis(app, strategy='aggregate').close()
+
+
+def test_async_aggregator_strategy(aggregated):
+    """Test that aggregate strategy uses AsyncAggregator."""
+
+    assert isinstance(aggregated._aggregator, AsyncAggregator)
+    assert isinstance(aggregated._redis_client, FakeAsyncProvider)
+
+
+def test_async_aggregated_get(aggregated):
+    """Test that the highest TTL wins and that slow nodes are skipped."""
+
+    assert run(aggregated.get('pattern')) == 'node2'
+    assert run(aggregated['pattern']) == 'node2'
+    aggregated._redis_nodes[1]._redis_client.delay = 2
+    assert run(aggregated['pattern']) in ['node1', 'node3']
+
+
+def test_async_aggregated_keys(aggregated):
+    """Test async aggregated keys method."""
+
+    run(aggregated.set('other', 'value'))
+    assert run(aggregated.keys('*')) == ['other', 'pattern']
+
+
+def test_async_aggregated_set_and_delete(aggregated):
+    """Test async aggregated set and delete methods."""
+
+    assert run(aggregated.set('key', 'value')) is True
+    for node in aggregated._redis_nodes:
+        assert node._redis_client.data['key'] == 'value'
+    assert run(aggregated.delete('key')) == 3
+
+
+def test_async_aggregated_scan_iter(aggregated):
+    """Test that async aggregated scan_iter yields each key once."""
+
+    async def scan():
+        return [key async for key in aggregated.scan_iter('*')]
+
+    assert run(scan()) == ['pattern']
+
+
+def test_async_aggregated_scan_iter_streams_pages(aggregated):
+    """Test that async aggregated scan_iter yields keys page by page,
+    without waiting for slow nodes."""
+
+    nodes = aggregated._redis_nodes
+    for node in nodes:
+        client = node._redis_client
+        client.data = dict(('key{0}'.format(i), i) for i in range(25))
+    nodes[2]._redis_client.delay = 0.2
+    requested = []
+    original_scan = FakeAsyncProvider.scan
+
+    async def counting_scan(self, cursor=0, match=None, count=None):
+        requested.append((self.name, cursor))
+        return await original_scan(self, cursor, match, count)
+
+    async def first_keys():
+        keys = []
+        iterator = aggregated.scan_iter(count=10)
+        async for key in iterator:
+            keys.append(key)
+            if len(keys) == 5:
+                break
+        # Pending SCAN calls are cancelled when the iterator is closed
+        await iterator.aclose()
+        return keys
+
+    async def all_keys():
+        return [key async for key in aggregated.scan_iter(count=10)]
+
+    FakeAsyncProvider.scan = counting_scan
+    try:
+        assert len(run(first_keys())) == 5
+        assert ('node3', 10) not in requested
+        assert sorted(run(all_keys())) == sorted(nodes[0]._redis_client.data)
+    finally:
+        FakeAsyncProvider.scan = original_scan
+
+
+def test_async_loadbalanced_getitem(loadbalanced):
+    """Test async loadbalanced __getitem__ method."""
+
+    assert run(loadbalanced['pattern']) in ['node1', 'node2', 'node3']
+    loadbalanced._redis_nodes = []
+    assert run(loadbalanced['pattern']) is None
+
+
+def test_async_item_assignment_is_refused(aggregated):
+    """Test that item assignment and deletion cannot be awaited."""
+
+    with pytest.raises(TypeError):
+        aggregated['key'] = 'value'
+    with pytest.raises(TypeError):
+        del aggregated['key']
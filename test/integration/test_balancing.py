@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis circuit breakers and balancers."""
+
+from time import sleep
+
+from flask_multi_redis.balancer import (LeastOutstandingBalancer,
+                                        PowerOfTwoBalancer, WeightedBalancer)
+from flask_multi_redis.health import CircuitBreaker
+from flask_multi_redis.main import FlaskMultiRedis
+import pytest
+from redis.exceptions import ConnectionError
+from test.integration.fakes import Pipeline
+
+
+def test_circuit_breaker_states():
+    """Test that a circuit opens after consecutive failures, then goes
+    half-open after its reset timeout."""
+
+    opened = []
+    circuit = CircuitBreaker(failure_threshold=2, reset_timeout=0.05,
+                             on_open=lambda: opened.append(True))
+    circuit.record_failure()
+    circuit.record_success()
+    circuit.record_failure()
+    assert circuit.available()
+    circuit.record_failure()
+    assert not circuit.available()
+    assert opened == [True]
+    assert not circuit.should_probe()
+    sleep(0.06)
+    assert circuit.should_probe()
+    circuit.record_failure()
+    assert circuit.state == 'open'
+    assert opened == [True, True]
+    sleep(0.06)
+    assert circuit.should_probe()
+    circuit.record_success()
+    assert circuit.available()
+
+
+def test_loadbalanced_skips_failing_nodes(app):
+    """Test that nodes failing with connection errors stop receiving
+    traffic, and receive it again once a probe succeeds."""
+
+    class FlakyProvider(object):
+        def __init__(self, **kwargs):
+            self.host = kwargs['host']
+            self.down = self.host == 'down'
+
+        def get(self, name):
+            if self.down:
+                raise ConnectionError()
+            return self.host
+
+        def ping(self):
+            if self.down:
+                raise ConnectionError()
+            return True
+
+    app.config['REDIS_NODES'] = [{'host': 'up'}, {'host': 'down'}]
+    app.config['REDIS_CIRCUIT_FAILURE_THRESHOLD'] = 2
+    app.config['REDIS_CIRCUIT_RESET_TIMEOUT'] = 0
+    app.config['REDIS_HEALTH_CHECK_INTERVAL'] = 0.01
+    redis = FlaskMultiRedis.from_custom_provider(FlakyProvider, app)
+    down = redis._redis_nodes[1]
+    errors = 0
+    for _ in range(50):
+        try:
+            assert redis['key'] == 'up'
+        except ConnectionError:
+            errors += 1
+    assert errors == 2
+    assert not down.circuit.available()
+    assert redis._health_checker._thread is not None
+    down._redis_client.down = False
+    sleep(0.2)
+    assert down.circuit.available()
+    assert redis._health_checker._thread is None
+    assert 'down' in [redis['key'] for _ in range(50)]
+    redis.close()
+
+
+def test_loadbalanced_delete_skips_open_circuits(app):
+    """Test that item deletion is not sent to nodes whose circuit is open."""
+
+    class DeleteProvider(object):
+        def __init__(self, **kwargs):
+            self.down = kwargs['host'] == 'down'
+            self.deleted = []
+
+        def delete(self, name):
+            if self.down:
+                raise ConnectionError()
+            self.deleted.append(name)
+            return 1
+
+    app.config['REDIS_NODES'] = [{'host': 'up'}, {'host': 'down'}]
+    app.config['REDIS_CIRCUIT_FAILURE_THRESHOLD'] = 1
+    app.config['REDIS_CIRCUIT_RESET_TIMEOUT'] = 60
+    redis = FlaskMultiRedis.from_custom_provider(DeleteProvider, app)
+    up, down = redis._redis_nodes
+    with pytest.raises(ConnectionError):
+        del redis['key']
+    assert not down.circuit.available()
+    del redis['key']
+    assert up._redis_client.deleted == ['key', 'key']
+    assert down.stats.snapshot()['requests'] == 1
+    redis.close()
+
+
+def test_pipeline_failures_reach_the_circuit(app):
+    """Test that pipelines are tracked when executed, so that their
+    failures open the circuit of their node."""
+
+    class PipelineProvider(object):
+        def __init__(self, **kwargs):
+            self.down = False
+
+        def pipeline(self, transaction=True):
+            provider = self
+
+            class FailingPipeline(Pipeline):
+                def execute(self, raise_on_error=True):
+                    if provider.down:
+                        raise ConnectionError()
+                    return super(FailingPipeline, self).execute()
+            return FailingPipeline(self)
+
+        def get(self, name):
+            return name
+
+    app.config['REDIS_CIRCUIT_FAILURE_THRESHOLD'] = 2
+    redis = FlaskMultiRedis.from_custom_provider(PipelineProvider, app)
+    node = redis._redis_nodes[0]
+    assert node.pipeline().get('key').execute() == ['key']
+    assert node.stats.snapshot()['requests'] == 1
+    node._redis_client.down = True
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            node.pipeline().get('key').execute()
+    assert node.stats.snapshot()['errors'] == 2
+    assert not node.circuit.available()
+    redis.close()
+
+
+def test_weighted_balancer(balanced_app):
+    """Test that the weighted balancer follows node weights."""
+
+    redis = FlaskMultiRedis.from_custom_provider(
+        balanced_app.provider, balanced_app, balancer='weighted'
+    )
+    assert isinstance(redis._balancer, WeightedBalancer)
+    hosts = [redis['key'] for _ in range(1000)]
+    assert 800 < hosts.count('local') < 980
+
+
+def test_power_of_two_balancer(balanced_app):
+    """Test that the power of two choices balancer prefers fast nodes."""
+
+    redis = FlaskMultiRedis.from_custom_provider(
+        balanced_app.provider, balanced_app, balancer='p2c'
+    )
+    assert isinstance(redis._balancer, PowerOfTwoBalancer)
+    redis._redis_nodes[0].stats.end(0.001)
+    redis._redis_nodes[1].stats.end(0.1)
+    hosts = [redis['key'] for _ in range(100)]
+    assert hosts == ['local'] * 100
+
+
+def test_least_outstanding_balancer(balanced_app):
+    """Test that the least outstanding balancer avoids busy nodes."""
+
+    redis = FlaskMultiRedis.from_custom_provider(
+        balanced_app.provider, balanced_app, balancer='least_outstanding'
+    )
+    assert isinstance(redis._balancer, LeastOutstandingBalancer)
+    redis._redis_nodes[0].stats.begin()
+    assert [redis['key'] for _ in range(20)] == ['remote'] * 20
+
+
+def test_custom_balancer(balanced_app):
+    """Test that any object with a pick method can balance requests."""
+
+    class LastBalancer(object):
+        def pick(self, nodes):
+            return nodes[-1]
+
+    redis = FlaskMultiRedis.from_custom_provider(
+        balanced_app.provider, balanced_app, balancer=LastBalancer()
+    )
+    assert redis['key'] == 'remote'
+    with pytest.raises(AssertionError):
+        FlaskMultiRedis(balancer='fastest')
+
+
+def test_node_stats(balanced_app):
+    """Test that per-node statistics can be inspected."""
+
+    redis = FlaskMultiRedis.from_custom_provider(
+        balanced_app.provider, balanced_app, balancer=WeightedBalancer()
+    )
+    for _ in range(10):
+        redis['key']
+    stats = redis.node_stats()
+    assert sorted(stats) == ['local:6379/0', 'remote:6379/0']
+    assert sum(x['requests'] for x in stats.values()) == 10
+    assert stats['local:6379/0']['weight'] == 9
+    assert stats['local:6379/0']['outstanding'] == 0
+    assert stats['remote:6379/0']['circuit'] == 'closed'
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis caches and read batching."""
+
+from threading import Thread
+from time import sleep
+
+import flask
+from flask_multi_redis.batcher import Batcher
+from flask_multi_redis.local_cache import MISSING, CacheInvalidator, LocalCache
+from flask_multi_redis.main import FlaskMultiRedis
+from flask_multi_redis.request_cache import SingleFlight
+import pytest
+
+
+def test_local_cache_lru_eviction():
+    """Test that the local cache evicts least recently used entries."""
+
+    cache = LocalCache(max_entries=2, max_bytes=10)
+    cache.set('a', 'aaaa')
+    cache.set('b', 'bbbb')
+    assert cache.get('a') == 'aaaa'
+    cache.set('c', 'cccc')
+    assert cache.get('b') is MISSING
+    cache.set('d', 'dddddd')
+    assert cache.get('a') is MISSING
+    assert cache.get('d') == 'dddddd'
+    cache.set('e', 'e' * 11)
+    assert cache.get('e') is MISSING
+    cache.set('f', None)
+    assert cache.get('f') is MISSING
+    assert cache.stats() == {
+        'entries': 2,
+        'bytes': 10,
+        'hits': 2,
+        'misses': 4,
+        'evictions': 2,
+        'invalidations': 0
+    }
+
+
+def test_local_cache_expiration():
+    """Test that entries expire after the shortest of both TTLs."""
+
+    cache = LocalCache(ttl=60)
+    cache.set('short', 'value', ttl=0.05)
+    cache.set('forever', 'value', ttl=-1)
+    sleep(0.06)
+    assert cache.get('short') is MISSING
+    assert cache.get('forever') == 'value'
+    assert cache.size == 5
+
+
+def test_local_cache_invalidation():
+    """Test that entries can be invalidated by str or bytes keys."""
+
+    cache = LocalCache()
+    cache.set('key', 'value')
+    cache.set('other', 'value')
+    cache.invalidate(b'key')
+    assert cache.get('key') is MISSING
+    cache.clear()
+    assert cache.get('other') is MISSING
+    assert cache.stats()['invalidations'] == 2
+
+
+def test_local_cache_in_front_of_aggregator(app, memory_nodes):
+    """Test that item access goes through the local cache, bounded by the
+    Redis TTL, and that writes invalidate it."""
+
+    app.config['REDIS_LOCAL_CACHE_MAX_ENTRIES'] = 10
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    redis['key'] = 'value'
+    assert redis['key'] == 'value'
+    memory_nodes[0].data['key'] = 'stale'
+    assert redis['key'] == 'value'
+    redis['key'] = 'new'
+    assert redis['key'] == 'new'
+    del redis['key']
+    assert redis['key'] is None
+    for node in memory_nodes:
+        node.set('short', 'value', ex=0.05)
+    assert redis['short'] == 'value'
+    for node in memory_nodes:
+        node.delete('short')
+    sleep(0.06)
+    assert redis['short'] is None
+    stats = redis.cache_stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 5
+    assert FlaskMultiRedis(flask.Flask(__name__)).cache_stats() is None
+
+
+def test_local_cache_cleared_by_proxied_writes(app, memory_nodes):
+    """Test that writes made with proxied commands, pipelines or scripts
+    drop local cache entries."""
+
+    app.config['REDIS_LOCAL_CACHE_MAX_ENTRIES'] = 10
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    redis['key'] = 'old'
+    assert redis['key'] == 'old'
+    redis.set('key', 'newer')
+    assert redis['key'] == 'newer'
+    pipe = redis.pipeline()
+    pipe.set('key', 'piped')
+    assert redis['key'] == 'newer'
+    pipe.execute()
+    assert redis['key'] == 'piped'
+    redis.register_script('set', 'return redis.call("SET", KEYS[1], 1)')
+
+    def run_script(script, keys, args):
+        for node in memory_nodes:
+            node.set(keys[0], 'scripted')
+    redis._aggregator.run_script = run_script
+    redis.run_script('set', ['key'])
+    assert redis['key'] == 'scripted'
+    assert redis.mget(['key']) == ['scripted']
+    assert redis.cache_stats()['invalidations'] == 3
+
+
+def test_local_cache_keeps_encoded_values(app, memory_nodes):
+    """Test that values are cached encoded, so that their encoded size is
+    accounted for and callers do not share decoded objects."""
+
+    app.config['REDIS_LOCAL_CACHE_MAX_ENTRIES'] = 100
+    app.config['REDIS_LOCAL_CACHE_MAX_BYTES'] = 1000
+    app.config['REDIS_SERIALIZER'] = 'json'
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    value = {'items': list(range(100))}
+    for i in range(5):
+        redis['key{0}'.format(i)] = value
+        assert redis['key{0}'.format(i)] == value
+    payload = len(memory_nodes[0].data['key4'])
+    cached = redis['key4']
+    cached['items'].append('mutated')
+    assert redis['key4'] == value
+    stats = redis.cache_stats()
+    assert stats['entries'] == 1000 // payload
+    assert stats['bytes'] == stats['entries'] * payload
+    assert stats['evictions'] == 5 - stats['entries']
+
+
+def test_local_cache_keyspace_invalidation(memory_nodes):
+    """Test that keyspace notifications invalidate cached entries."""
+
+    class PubSub(object):
+        def __init__(self, messages):
+            self.messages = messages
+
+        def psubscribe(self, pattern):
+            assert pattern == '__keyspace@0__:*'
+
+        def get_message(self, timeout):
+            if self.messages:
+                return self.messages.pop(0)
+            sleep(0.01)
+
+        def close(self):
+            pass
+
+    node = memory_nodes[0]
+    node.config['db'] = 0
+    node._redis_client = node
+    messages = [{'channel': b'__keyspace@0__:key'}]
+    node.pubsub = lambda ignore_subscribe_messages: PubSub(messages)
+    cache = LocalCache()
+    cache.set('key', 'value')
+    invalidator = CacheInvalidator(cache, [node], 'keyspace')
+    invalidator.start()
+    sleep(0.05)
+    invalidator.stop()
+    assert cache.get('key') is MISSING
+
+
+def test_single_flight_merges_concurrent_calls():
+    """Test that concurrent calls for a key run only once."""
+
+    flight = SingleFlight()
+    calls = []
+
+    def slow(key):
+        calls.append(key)
+        sleep(0.1)
+        return key.upper()
+    results = []
+    threads = [Thread(target=lambda: results.append(flight.do('a', slow, 'a')))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert calls == ['a']
+    assert results == ['A'] * 5
+    assert flight.calls == 1
+    assert flight.merged == 4
+    assert flight.do('a', slow, 'a') == 'A'
+    assert calls == ['a', 'a']
+
+
+def test_request_cache(app, memory_nodes):
+    """Test that reads are memoized for the request and writes invalidate
+    them."""
+
+    app.config['REDIS_REQUEST_CACHE'] = True
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    for node in memory_nodes:
+        node.set('key', 'old')
+    with app.test_request_context():
+        assert redis['key'] == 'old'
+        for node in memory_nodes:
+            node.set('key', 'changed')
+        assert redis['key'] == 'old'
+        redis['key'] = 'new'
+        assert redis['key'] == 'new'
+        redis.set('key', 'newer')
+        assert redis['key'] == 'newer'
+        del redis['key']
+        assert redis['key'] is None
+    for node in memory_nodes:
+        node.set('key', 'other')
+    with app.test_request_context():
+        assert redis['key'] == 'other'
+    assert redis['key'] == 'other'
+    stats = redis.request_cache_stats()
+    assert stats['hits'] == 1
+    assert stats['calls'] == 6
+
+
+def test_batcher_merges_concurrent_reads():
+    """Test that concurrent reads are fetched in shared batches."""
+
+    fetched = []
+
+    def fetch(keys):
+        fetched.append(list(keys))
+        if 'error' in keys:
+            raise ValueError('error')
+        return [key.upper() for key in keys]
+    batcher = Batcher(fetch, window=0.1, max_keys=4)
+    results = {}
+
+    def read(key):
+        results[key] = batcher.get(key)
+    threads = [Thread(target=read, args=(key,))
+               for key in ['a', 'b', 'c', 'a', 'd', 'e']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {'a': 'A', 'b': 'B', 'c': 'C', 'd': 'D', 'e': 'E'}
+    assert sorted(sum(fetched, [])) == ['a', 'b', 'c', 'd', 'e']
+    assert max(len(keys) for keys in fetched) <= 4
+    assert len(fetched) < 5
+    stats = batcher.stats()
+    assert stats['reads'] == 6
+    assert stats['keys'] == 5
+    with pytest.raises(ValueError):
+        batcher.get('error')
+
+
+def test_aggregator_batched_get(app, memory_nodes):
+    """Test that aggregated get goes through mget when batching is on."""
+
+    app.config['REDIS_BATCH_WINDOW'] = 0.001
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    memory_nodes[0].set('key', 'old', ex=10)
+    memory_nodes[1].set('key', 'new', ex=100)
+    assert redis['key'] == 'new'
+    assert redis.get('missing') is None
+    assert redis.get('key', read_strategy='first') in ['old', 'new']
+    assert redis.batch_stats() == {'batches': 2, 'reads': 2, 'keys': 2}
+    assert FlaskMultiRedis(app).batch_stats() is None
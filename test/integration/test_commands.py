@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis pipelines, commands and scripts."""
+
+from flask_multi_redis import merge_policies
+import pytest
+from redis.exceptions import NoScriptError
+from test.integration.fakes import Pipeline
+
+
+def test_aggregated_pipeline(memory_aggregated, memory_nodes):
+    """Test that pipelines send one batch per node and merge replies like
+    aggregated commands."""
+
+    batches = []
+    for node in memory_nodes:
+        node.pipeline = lambda transaction, node=node: \
+            batches.append(transaction) or Pipeline(node)
+    for ttl, node in enumerate(memory_nodes):
+        node.set('key', node.name, ex=ttl + 1)
+    memory_nodes[0].set('other', 'value')
+    with memory_aggregated.pipeline() as pipe:
+        pipe.set('new', 'value').get('key').delete('new', 'other')
+        assert len(pipe) == 3
+        assert pipe.execute() == [True, 'node4', 5]
+    assert batches == [True] * 4
+    assert memory_aggregated.pipeline(transaction=False).execute() == []
+    with pytest.raises(NotImplementedError):
+        memory_aggregated.pipeline().blpop('key')
+
+
+def test_merge_policies():
+    """Test that merge policies combine node replies."""
+
+    assert merge_policies.first_non_null([None, 0, 1]) == 0
+    assert merge_policies.max_ttl([(5, 'a'), (9, 'b'), (20, None)]) == 'b'
+    assert merge_policies.total([1, 2, None]) == 3
+    assert merge_policies.union([['a'], ['b', 'a'], None]) == set(['a', 'b'])
+    assert merge_policies.intersection([['a', 'b'], ['b']]) == set(['b'])
+    assert merge_policies.sorted_merge([['c', 'a'], ['b', 'a']]) == \
+        ['a', 'b', 'c']
+    assert merge_policies.all_equal([{'a': 1}, {'a': 1}])
+    assert not merge_policies.all_equal([1, 2])
+
+
+def test_aggregated_registered_commands(memory_aggregated, memory_nodes):
+    """Test that registered commands are fanned out and merged with their
+    policy, and that custom commands can be registered."""
+
+    def commands(node):
+        def exists(*names):
+            return len([name for name in names if name in node.data])
+
+        def strlen(name):
+            return len(node.data.get(name, ''))
+        return exists, strlen
+
+    for ttl, node in enumerate(memory_nodes):
+        node.set('key', node.name, ex=ttl + 1)
+        node.exists, node.strlen = commands(node)
+    memory_nodes[0].set('only', 'here')
+    assert memory_aggregated.exists('only') == 1
+    assert memory_aggregated.strlen('key') == 5
+    for node in memory_nodes:
+        node.dbsize = lambda node=node: len(node.data)
+    # Every node holds a copy of the dataset
+    assert memory_aggregated.dbsize() == 2
+    aggregator = memory_aggregated._aggregator
+    aggregator.register_command('strlen', 'sum')
+    assert memory_aggregated.strlen('key') == 20
+    aggregator.register_command('strlen', lambda replies: sorted(replies))
+    assert memory_aggregated.strlen('key') == [5, 5, 5, 5]
+    with pytest.raises(KeyError):
+        aggregator.register_command('strlen', 'unknown')
+
+
+def test_scripts_in_aggregate_mode(memory_aggregated, memory_nodes):
+    """Test that scripts are loaded once per node, run with EVALSHA on every
+    node, reloaded on NOSCRIPT and merged with their policy."""
+
+    source = 'return redis.call("INCRBY", KEYS[1], ARGV[1])'
+    loads = []
+
+    def scripting(node):
+        node.scripts = {}
+
+        def script_load(script):
+            loads.append(node.name)
+            node.scripts[script] = True
+
+        def evalsha(sha, numkeys, *keys_and_args):
+            if not node.scripts:
+                raise NoScriptError('NOSCRIPT No matching script.')
+            key, increment = keys_and_args
+            node.data[key] = int(node.data.get(key, 0)) + increment
+            return node.data[key]
+        return script_load, evalsha
+
+    for node in memory_nodes:
+        node.script_load, node.evalsha = scripting(node)
+    memory_nodes[0].set('counter', 10)
+    script = memory_aggregated.register_script('incrby', source, 'max')
+    assert len(script.sha) == 40
+    assert memory_aggregated.run_script('incrby', ['counter'], [2]) == 12
+    assert memory_aggregated.run_script('incrby', ['counter'], [3]) == 15
+    assert sorted(loads) == ['node1', 'node2', 'node3', 'node4']
+    memory_nodes[1].scripts = {}
+    assert memory_aggregated.run_script('incrby', ['counter'], [1]) == 16
+    assert loads.count('node2') == 2
+    assert memory_nodes[1].data['counter'] == 6
@@ -3,26 +3,25 @@
 
 """Integration tests for Flask-Multi-Redis."""
 
+from gc import collect
+from os import getpid
+from threading import Thread
+from time import sleep, time
+from weakref import ref
+
+from benchmarks.suite import OPERATIONS, run_benchmark
 import flask
-from flask_multi_redis.aggregator import Aggregator
+from flask_multi_redis.aggregator import Aggregator, SeenKeys
+from flask_multi_redis.connection_pool import CLIENTS
+from flask_multi_redis.instrumentation import Histogram, Instrumentation
+from flask_multi_redis.local_cache import CacheInvalidator
 from flask_multi_redis.main import FlaskMultiRedis
+from flask_multi_redis.repair import AntiEntropy
+from flask_multi_redis.worker_pool import WorkerPool
 import pytest
-from redis import StrictRedis
-
-
-@pytest.fixture
-def app():
-    return flask.Flask(__name__)
-
-
-@pytest.fixture
-def loadbalanced(app):
-    return FlaskMultiRedis(app)
-
-
-@pytest.fixture
-def aggregated(app):
-    return FlaskMultiRedis(app, strategy='aggregate')
+from redis import BlockingConnectionPool, StrictRedis
+from redis.exceptions import ConnectionError
+from test.integration.fakes import MemoryNode, Pipeline
 
 
 @pytest.fixture
@@ -64,60 +63,6 @@ def app_custom_node(app):
     return app
 
 
-@pytest.fixture
-def fake_node():
-    class Node(object):
-        def __init__(self, name):
-            self.config = {'socket_timeout': 2}
-            self.name = name
-
-        def get(self, pattern):
-            return self.name
-
-        def ttl(self, pattern):
-            if int(self.name[-1]) == 3:
-                return None
-            return int(self.name[-1])
-
-        def keys(self, pattern):
-            if pattern == 'empty':
-                return []
-            if int(self.name[-1]) == 3:
-                return [self.name, pattern]
-            return [pattern]
-
-        def set(self, key, pattern):
-            setattr(self, key, pattern)
-            return True
-
-        def scan_iter(self, pattern):
-            return iter([getattr(self, pattern)])
-
-        def delete(self, pattern):
-            delattr(self, 'name')
-    return Node
-
-
-@pytest.fixture
-def mocked_loadbalanced(loadbalanced, fake_node):
-    loadbalanced._redis_nodes = [
-                                    fake_node('node1'),
-                                    fake_node('node2'),
-                                    fake_node('node3')
-                                ]
-    return loadbalanced
-
-
-@pytest.fixture
-def mocked_aggregated(aggregated, fake_node):
-    aggregated._aggregator._redis_nodes = [
-                                              fake_node('node1'),
-                                              fake_node('node2'),
-                                              fake_node('node3')
-                                          ]
-    return aggregated
-
-
 def test_constructor(loadbalanced):
     """Test that a constructor with app instance will initialize the
     connection."""
@@ -302,23 +247,69 @@ def test_transmission_of_not_implemented_method(aggregated):
     will properly raise an exception."""
 
     with pytest.raises(NotImplementedError) as e:
-        aggregated.mget
+        aggregated.blpop
 
-    message = 'NotImplementedError: mget is not implemented yet.'
+    message = 'blpop is not implemented yet.'
     message += ' Feel free to contribute.'
-    assert ' '.join(str(e).split(' ')[1:]) == message
+    assert str(e.value) == message
 
 
 def test_task_runner(mocked_aggregated):
     """Test task runner in nominal operations."""
 
-    def task(node, pattern, aggregator):
-        if node.name != 'node2':
-            aggregator._output_queue.put(pattern)
+    def task(node, pattern):
+        if node.name == 'node2':
+            raise ValueError(pattern)
+        return pattern
+
+    result = mocked_aggregated._aggregator._runner(task, 'pattern')
+    nodes = mocked_aggregated._aggregator._redis_nodes
+    assert sorted(result, key=lambda t: t[0].name) == [
+        (nodes[0], 'pattern'),
+        (nodes[2], 'pattern')
+    ]
 
-    kwargs = {'aggregator': mocked_aggregated._aggregator}
-    result = mocked_aggregated._aggregator._runner(task, 'pattern', **kwargs)
-    assert result == ['pattern', 'pattern']
+
+def test_task_runner_drops_late_results(mocked_aggregated):
+    """Test that a node answering after its timeout neither delays the
+    call nor leaks its result into the next one."""
+
+    aggregator = mocked_aggregated._aggregator
+    aggregator._redis_nodes[0].config['socket_timeout'] = 0.05
+
+    def task(node, pattern):
+        if node.name == 'node1':
+            sleep(0.2)
+        return node.name
+
+    start = time()
+    result = aggregator._runner(task, 'pattern')
+    assert time() - start < 2
+    assert sorted(x for _, x in result) == ['node2', 'node3']
+    sleep(0.3)
+    result = aggregator._runner(lambda node, pattern: pattern, 'next')
+    assert [x for _, x in result] == ['next', 'next', 'next']
+
+
+def test_concurrent_aggregated_calls(mocked_aggregated):
+    """Test that concurrent aggregated calls only get their own results."""
+
+    errors = []
+
+    def client(key):
+        for _ in range(50):
+            result = mocked_aggregated._aggregator._runner(
+                lambda node, pattern: pattern, key
+            )
+            if [x for _, x in result] != [key] * 3:
+                errors.append(result)
+
+    threads = [Thread(target=client, args=(str(i),)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
 
 
 def test_aggregator_get_method(mocked_aggregated):
@@ -327,12 +318,100 @@ def test_aggregator_get_method(mocked_aggregated):
     assert mocked_aggregated.get('pattern') == 'node2'
 
 
+def test_aggregator_get_method_uses_one_round_trip(mocked_aggregated,
+                                                    mocker):
+    """Test that aggregator get method fetches value and TTL in a single
+    pipeline per node."""
+
+    nodes = mocked_aggregated._aggregator._redis_nodes
+    spies = [mocker.spy(node, 'pipeline') for node in nodes]
+    assert mocked_aggregated.get('pattern') == 'node2'
+    for spy in spies:
+        assert spy.call_count == 1
+        assert [c[0] for c in spy.spy_return.commands] == ['get', 'ttl']
+
+
+def test_aggregator_get_method_without_ttl(mocked_aggregated):
+    """Test that aggregator get method can skip TTLs and return the first
+    non-empty answer."""
+
+    nodes = mocked_aggregated._aggregator._redis_nodes
+    nodes[0].ttl = None
+    nodes[0].pipeline = None
+    assert mocked_aggregated.get('pattern', ttl=False) in [
+        'node1', 'node2', 'node3'
+    ]
+    assert mocked_aggregated.get('missing', ttl=False) is None
+
+
+def test_aggregator_get_method_first_strategy(mocked_aggregated):
+    """Test that the first read strategy does not wait for slow nodes."""
+
+    nodes = mocked_aggregated._aggregator._redis_nodes
+    nodes[1].get = lambda pattern: sleep(1) or 'node2'
+    start = time()
+    assert mocked_aggregated.get('pattern', read_strategy='first') in [
+        'node1', 'node3'
+    ]
+    assert time() - start < 0.5
+
+
+def test_aggregator_get_method_quorum_strategy(mocked_aggregated):
+    """Test that the quorum read strategy returns once enough nodes agree
+    and falls back to the highest TTL otherwise."""
+
+    nodes = mocked_aggregated._aggregator._redis_nodes
+    nodes[0].get = lambda pattern: 'agreed'
+    nodes[1].get = lambda pattern: sleep(1) or 'late'
+    nodes[2].get = lambda pattern: 'agreed'
+    start = time()
+    assert mocked_aggregated.get('pattern', read_strategy='quorum') == 'agreed'
+    assert time() - start < 0.5
+    assert mocked_aggregated.get('pattern', read_strategy='quorum',
+                                 quorum=3) == 'late'
+
+
+def test_read_strategy_configuration(app):
+    """Test that the default read strategy is passed to the aggregator."""
+
+    redis = FlaskMultiRedis(app, strategy='aggregate',
+                            read_strategy='quorum', quorum=2)
+    assert redis._aggregator.read_strategy == 'quorum'
+    assert redis._aggregator.quorum == 2
+    with pytest.raises(AssertionError):
+        FlaskMultiRedis(app, read_strategy='fastest')
+
+
 def test_aggregator_keys_method(mocked_aggregated):
     """Test aggregator keys method."""
 
     assert mocked_aggregated.keys('pattern') == ['node3', 'pattern']
 
 
+def test_aggregator_keys_method_with_scan(memory_aggregated, mocker):
+    """Test that aggregator keys method can rely on SCAN, merge sorted node
+    listings and slice them."""
+
+    nodes = memory_aggregated._aggregator._redis_nodes
+    for i in range(20):
+        nodes[i % 4].set('key{0:02d}'.format(i), i)
+        nodes[(i + 2) % 4].set('key{0:02d}'.format(i), i)
+    nodes[1].set('other', 1)
+    expected = ['key{0:02d}'.format(i) for i in range(20)]
+    assert memory_aggregated.keys('key*') == expected
+    assert memory_aggregated.keys('key*', scan=True) == expected
+    assert memory_aggregated.keys(scan=True, limit=5, offset=18) == \
+        expected[18:] + ['other']
+    keys = memory_aggregated.iter_keys('key*', scan=True, count=100)
+    assert next(keys) == 'key00'
+    assert list(keys) == expected[1:]
+    # Both entry points list keys the same way by default
+    spies = [mocker.spy(node, 'scan_iter') for node in nodes]
+    assert list(memory_aggregated.iter_keys('key*')) == expected
+    assert memory_aggregated.keys('key*') == expected
+    assert sum(spy.call_count for spy in spies) == 0
+
+
 def test_aggregator_keys_method_with_empty_nodes(mocked_aggregated):
     """Test aggregator keys method with empty nodes."""
 
@@ -351,19 +430,106 @@ def test_aggregator_set_method(mocked_aggregated):
 def test_aggregator_delete_method(mocked_aggregated):
     """Test aggregator delete method."""
 
-    res = mocked_aggregated.delete('pattern')
+    res = mocked_aggregated.delete('name')
     assert type(res) is int
+    assert res == 3
     for node in mocked_aggregated._aggregator._redis_nodes:
         assert not hasattr(node, 'name')
 
 
-def test_aggregator_scan_iter_method(mocked_aggregated):
-    """Test aggregator scan_iter method."""
+def test_aggregator_delete_method_with_multiple_keys(mocked_aggregated):
+    """Test aggregator delete method with several keys."""
 
     for node in mocked_aggregated._aggregator._redis_nodes:
         node.set('value', 'pattern')
-    results = [x for x in mocked_aggregated.scan_iter('value')]
-    assert results == ['pattern', 'pattern', 'pattern']
+    assert mocked_aggregated.delete('name', 'value', 'missing') == 6
+    for node in mocked_aggregated._aggregator._redis_nodes:
+        assert not hasattr(node, 'value')
+
+
+def test_aggregator_mget_method(mocked_aggregated):
+    """Test that aggregator mget method applies the highest TTL rule per
+    key."""
+
+    assert mocked_aggregated.mget('pattern', 'missing') == ['node2', None]
+    assert mocked_aggregated.mget(['a', 'b'], 'c') == ['node2'] * 3
+    assert mocked_aggregated.mget([]) == []
+
+
+def test_aggregator_mset_method(mocked_aggregated):
+    """Test aggregator mset method."""
+
+    assert mocked_aggregated.mset({'value': 'pattern', 'other': 'x'}) is True
+    for node in mocked_aggregated._aggregator._redis_nodes:
+        assert node.value == 'pattern'
+        assert node.other == 'x'
+
+
+def test_aggregator_scan_iter_method(memory_aggregated):
+    """Test that aggregator scan_iter method walks every node and yields
+    each key once."""
+
+    nodes = memory_aggregated._aggregator._redis_nodes
+    for i in range(100):
+        nodes[i % 4].set('key{0}'.format(i), i)
+        nodes[(i + 1) % 4].set('key{0}'.format(i), i)
+    nodes[0].set('other', 'value')
+    results = list(memory_aggregated.scan_iter(match='key*', count=7))
+    assert sorted(results) == sorted('key{0}'.format(i) for i in range(100))
+    assert list(memory_aggregated.scan_iter('other')) == ['other']
+
+
+def test_aggregator_scan_iter_interleaves_nodes(memory_aggregated):
+    """Test that aggregator scan_iter yields keys as they arrive instead of
+    waiting for a slow node."""
+
+    nodes = memory_aggregated._aggregator._redis_nodes
+    for i in range(40):
+        nodes[i % 4].set('key{0}'.format(i), i)
+    scan = nodes[0].scan
+    nodes[0].scan = lambda **kwargs: sleep(0.5) or scan(**kwargs)
+    start = time()
+    results = memory_aggregated.scan_iter()
+    assert next(results) is not None
+    assert time() - start < 0.4
+    results.close()
+
+
+def test_aggregator_scan_iter_skips_failing_nodes(memory_aggregated):
+    """Test that aggregator scan_iter ignores nodes raising errors."""
+
+    nodes = memory_aggregated._aggregator._redis_nodes
+    nodes[0].set('lost', 1)
+    nodes[1].set('found', 1)
+    nodes[0].scan = None
+    assert list(memory_aggregated.scan_iter()) == ['found']
+
+
+def test_aggregator_scan_iter_gives_up_on_slow_nodes(memory_aggregated,
+                                                    memory_nodes):
+    """Test that scan_iter stops waiting for nodes past their timeout."""
+
+    def slow_scan(cursor=0, match=None, count=None):
+        sleep(0.2)
+        return 0, ['late']
+
+    for node in memory_nodes:
+        node.config['socket_timeout'] = 0.05
+    memory_nodes[0].scan = slow_scan
+    memory_nodes[1].set('key', 'value')
+    assert list(memory_aggregated.scan_iter()) == ['key']
+
+
+def test_seen_keys_is_bounded():
+    """Test that SeenKeys forgets old keys to bound its memory."""
+
+    seen = SeenKeys(max_size=4)
+    assert [seen.add(key) for key in 'abab'] == [True, True, False, False]
+    for key in 'cdef':
+        seen.add(key)
+    assert len(seen._current) + len(seen._previous) <= 4
+    assert seen.add('a') is True
+    assert seen.add('f') is False
 
 
 def test_loadbalanced_getitem_method(mocked_loadbalanced):
@@ -419,3 +585,319 @@ def test_aggregated_delitem_method(mocked_aggregated):
         assert not hasattr(node, 'name')
     mocked_aggregated._aggregator._redis_nodes = []
     del(mocked_aggregated['name'])
+
+
+def test_aggregate_workers_configuration(app):
+    """Test that aggregate workers count is read from configuration and
+    defaults to four workers per node."""
+
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    assert redis._aggregator._pool is redis._pool
+    assert redis._pool.workers == 4
+
+    app.config['REDIS_AGGREGATE_WORKERS'] = 2
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    assert redis._pool.workers == 2
+
+
+def test_aggregator_reuses_worker_threads(mocked_aggregated):
+    """Test that aggregated commands are run by long-lived workers."""
+
+    pool = mocked_aggregated._pool
+    mocked_aggregated.get('pattern')
+    threads = list(pool._threads)
+    assert len(threads) == 4
+    assert mocked_aggregated.get('pattern') == 'node2'
+    assert pool._threads == threads
+    mocked_aggregated.close()
+    assert pool._threads == []
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_init_app_again_shuts_down_previous_pool(app, memory_nodes):
+    """Test that initializing an instance again stops its previous pool
+    and that instances can be freed once dropped."""
+
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    redis.get('key')
+    pool = redis._pool
+    threads = list(pool._threads)
+    assert threads
+    redis.init_app(app)
+    assert redis._pool is not pool
+    assert pool._threads == []
+    assert not any(thread.is_alive() for thread in threads)
+    reference = ref(redis)
+    redis.close()
+    del redis
+    del app.extensions['redis']
+    collect()
+    assert reference() is None
+
+
+def test_dropped_instances_stop_their_pool(app, memory_nodes):
+    """Test that worker threads stop once an instance is dropped without
+    being closed."""
+
+    threads = []
+    for _ in range(3):
+        redis = FlaskMultiRedis(app, strategy='aggregate')
+        redis._aggregator._redis_nodes = memory_nodes
+        redis.get('key')
+        threads.extend(redis._pool._threads)
+    assert len(threads) == 3 * 4
+    del redis
+    del app.extensions['redis']
+    collect()
+    for thread in threads:
+        thread.join(1)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_worker_pool_without_workers_spawns_threads():
+    """Test that a pool without workers runs each task in its own thread."""
+
+    pool = WorkerPool(0)
+    task = pool.submit(lambda x: x * 2, 21)
+    assert task.wait(2)
+    assert task.result == 42
+    assert pool._threads == []
+
+
+def test_worker_pool_task_exception():
+    """Test that an exception raised by a task is stored on it."""
+
+    pool = WorkerPool(1)
+    task = pool.submit(int, 'nan')
+    assert task.wait(2)
+    assert isinstance(task.exception, ValueError)
+    pool.shutdown()
+
+
+def test_histogram_buckets():
+    """Test that histograms count values in cumulative buckets."""
+
+    histogram = Histogram((0.1, 1))
+    for value in [0.05, 0.1, 0.5, 2]:
+        histogram.observe(value)
+    assert histogram.cumulative() == [(0.1, 2), (1, 3), (float('inf'), 4)]
+    assert histogram.snapshot()['count'] == 4
+    assert histogram.snapshot()['sum'] == 2.65
+
+
+def test_instrumentation_of_node_commands(balanced_app):
+    """Test that node commands are timed per node and command, and can be
+    rendered for Prometheus."""
+
+    balanced_app.config['REDIS_INSTRUMENTATION'] = True
+    redis = FlaskMultiRedis.from_custom_provider(balanced_app.provider,
+                                                 balanced_app)
+    for _ in range(10):
+        redis['key']
+    stats = redis.instrumentation_stats()['nodes']
+    assert sum(stats[node]['get']['count'] for node in stats) == 10
+    assert stats['local:6379/0']['get']['errors'] == 0
+    text = redis.instrumentation.render_prometheus()
+    line = 'flask_multi_redis_command_duration_seconds_count'
+    line += '{command="get",node="local:6379/0"} '
+    assert line in text
+    assert FlaskMultiRedis(flask.Flask(__name__)).instrumentation_stats() \
+        is None
+
+
+def test_instrumentation_of_aggregated_calls(memory_nodes):
+    """Test that aggregated calls record fan-out width, timeouts and results
+    coming too late."""
+
+    def slow_pipeline(transaction=True):
+        sleep(0.2)
+        return Pipeline(memory_nodes[3])
+
+    for node in memory_nodes:
+        node.config['socket_timeout'] = 0.05
+    memory_nodes[3].pipeline = slow_pipeline
+    events = []
+    aggregator = Aggregator(memory_nodes)
+    aggregator.instrumentation = Instrumentation()
+    aggregator.instrumentation.add_hook(
+        lambda *event: events.append(event)
+    )
+    aggregator.get('key')
+    sleep(0.3)
+    snapshot = aggregator.instrumentation.snapshot()
+    assert snapshot['fanout']['sum'] == 4
+    assert ('fanout', None, None, 4) in events
+    stats = snapshot['nodes']['node4']['get_with_ttl']
+    assert stats['timeouts'] == 1
+    assert stats['late'] == 1
+    assert stats['count'] == 0
+    # Fake nodes do not time their own commands
+    assert 'node1' not in snapshot['nodes']
+
+
+def test_instrumentation_counts_aggregated_commands_once(app):
+    """Test that aggregated commands are recorded once per node, and that
+    pipelines are timed when executed."""
+
+    class SlowPipeline(Pipeline):
+        def execute(self, raise_on_error=True):
+            sleep(0.01)
+            return super(SlowPipeline, self).execute(raise_on_error)
+
+    class MemoryProvider(MemoryNode):
+        def __init__(self, **kwargs):
+            super(MemoryProvider, self).__init__(kwargs['host'])
+
+        def pipeline(self, transaction=True):
+            return SlowPipeline(self)
+
+    app.config['REDIS_NODES'] = [{'host': 'node1'}, {'host': 'node2'}]
+    app.config['REDIS_INSTRUMENTATION'] = True
+    redis = FlaskMultiRedis.from_custom_provider(MemoryProvider, app,
+                                                 strategy='aggregate')
+    redis['key'] = 'value'
+    assert redis['key'] == 'value'
+    stats = redis.instrumentation_stats()['nodes']
+    assert sorted(stats) == ['node1:6379/0', 'node2:6379/0']
+    for node in stats.values():
+        assert sorted(node) == ['pipeline', 'set']
+        assert node['set']['count'] == 1
+        assert node['pipeline']['count'] == 1
+        assert node['pipeline']['sum'] >= 0.01
+    redis.close()
+
+
+@pytest.mark.parametrize('strategy', ['loadbalancing', 'aggregate'])
+def test_benchmark_suite(strategy):
+    """Test that every benchmarked operation runs on the fake provider."""
+
+    for operation in OPERATIONS:
+        result = run_benchmark(strategy, 2, operation, calls=5, clients=2,
+                               latency=0, keys=20)
+        assert result['ops'] > 0
+        assert result['p50'] <= result['p99']
+
+
+def test_connection_pools_are_shared(app):
+    """Test that nodes with identical configurations share their pool, even
+    across FlaskMultiRedis instances."""
+
+    redis_a = FlaskMultiRedis(app)
+    redis_b = FlaskMultiRedis(app)
+    assert redis_a.connection_pool is redis_b.connection_pool
+    app.config['REDIS_DEFAULT_DB'] = 1
+    redis_c = FlaskMultiRedis(app)
+    assert redis_a.connection_pool is not redis_c.connection_pool
+
+
+def test_connection_pool_configuration(app):
+    """Test that pools can be bounded and blocking, per node or by default."""
+
+    app.config['REDIS_DEFAULT_MAX_CONNECTIONS'] = 8
+    app.config['REDIS_DEFAULT_BLOCKING_POOL'] = True
+    app.config['REDIS_DEFAULT_POOL_TIMEOUT'] = 3
+    app.config['REDIS_DEFAULT_SOCKET_KEEPALIVE'] = True
+    app.config['REDIS_NODES'] = [
+        {'host': 'localhost'},
+        {'host': 'localhost', 'db': 1, 'max_connections': 2}
+    ]
+    redis = FlaskMultiRedis(app)
+    first, second = [node.connection_pool for node in redis._redis_nodes]
+    assert isinstance(first, BlockingConnectionPool)
+    assert first.max_connections == 8
+    assert first.timeout == 3
+    assert first.connection_kwargs['socket_keepalive'] is True
+    assert second.max_connections == 2
+
+
+def test_connection_pools_reset_after_fork(app):
+    """Test that connections inherited from a parent process are dropped."""
+
+    pool = FlaskMultiRedis(app).connection_pool
+    pool._available_connections.append(pool.make_connection())
+    CLIENTS.reset()
+    assert pool._available_connections == []
+
+
+def test_background_threads_restart_after_fork(app, memory_nodes):
+    """Test that invalidation listeners and anti-entropy started in a
+    parent process start again in a forked child, on first use."""
+
+    app.config['REDIS_LOCAL_CACHE_MAX_ENTRIES'] = 10
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    invalidator = CacheInvalidator(redis._local_cache, [], 'keyspace')
+    anti_entropy = AntiEntropy(redis._aggregator, interval=60, rate=0)
+    redis._cache_invalidator = invalidator
+    redis._anti_entropy = anti_entropy
+    invalidator.start()
+    anti_entropy.start()
+    thread = anti_entropy._thread
+    anti_entropy.start()
+    assert anti_entropy._thread is thread
+    redis['key'] = 'value'
+    assert redis['key'] == 'value'
+    # Pretend the instance was initialized in a parent process
+    redis._pid = invalidator._pid = anti_entropy._pid = -1
+    assert redis['key'] == 'value'
+    assert invalidator._pid == getpid()
+    assert anti_entropy._pid == getpid()
+    assert anti_entropy._thread is not thread
+    assert anti_entropy._thread.is_alive()
+    # Invalidations may have been missed since the fork
+    assert redis.cache_stats()['invalidations'] == 1
+    redis.close()
+    assert not thread.is_alive()
+
+
+def test_nodes_are_created_lazily(app):
+    """Test that node clients are created on first use and that their
+    methods are only looked up once."""
+
+    class CountingProvider(object):
+        created = []
+
+        def __init__(self, **kwargs):
+            self.created.append(kwargs['host'])
+
+        def get(self, name):
+            return name
+
+    app.config['REDIS_NODES'] = [{'host': 'first'}, {'host': 'second'}]
+    redis = FlaskMultiRedis.from_custom_provider(CountingProvider, app)
+    assert CountingProvider.created == []
+    node = redis._redis_nodes[0]
+    assert node.get('key') == 'key'
+    assert CountingProvider.created == ['first']
+    assert 'get' in node.__dict__
+    assert node.get is node.get
+    node._redis_client = CountingProvider(host='third')
+    assert 'get' not in node.__dict__
+
+
+def test_warm_up(app):
+    """Test that warm-up opens connections to every node in parallel."""
+
+    class Pool(object):
+        def __init__(self, host):
+            self.host = host
+            self.released = 0
+
+        def get_connection(self):
+            if self.host == 'down':
+                raise ConnectionError()
+            return self
+
+        def release(self, connection):
+            self.released += 1
+
+    class PooledProvider(object):
+        def __init__(self, **kwargs):
+            self.connection_pool = Pool(kwargs['host'])
+
+    app.config['REDIS_NODES'] = [{'host': 'up'}, {'host': 'down'}]
+    redis = FlaskMultiRedis.from_custom_provider(PooledProvider, app)
+    results = redis.warm_up(connections=3)
+    assert results == {'up:6379/0': True, 'down:6379/0': False}
+    assert redis._redis_nodes[0].connection_pool.released == 3
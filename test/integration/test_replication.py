@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis replication and repair."""
+
+from flask_multi_redis.aggregator import Aggregator
+from flask_multi_redis.balancer import NodeStats
+from flask_multi_redis.main import FlaskMultiRedis
+from flask_multi_redis.repair import AntiEntropy, authority, lags, repair
+import pytest
+from redis.exceptions import ConnectionError
+
+
+@pytest.fixture
+def replicated(app, memory_nodes):
+    app.config['REDIS_ZONE'] = 'local'
+    redis = FlaskMultiRedis(app, strategy='replicated')
+    for node in memory_nodes:
+        node.zone = 'remote'
+    memory_nodes[2].zone = 'local'
+    redis._aggregator._redis_nodes = memory_nodes
+    return redis
+
+
+def test_replicated_writes_everywhere_and_reads_locally(replicated,
+                                                        memory_nodes):
+    """Test that writes reach every node and reads the local one only."""
+
+    replicated['key'] = 'value'
+    replicated.mset({'other': 'value'})
+    for node in memory_nodes:
+        assert node.data == {'key': 'value', 'other': 'value'}
+    memory_nodes[2].data['key'] = 'local'
+    assert [replicated['key'] for _ in range(20)] == ['local'] * 20
+    assert replicated.get_with_ttl('key') == (-1, 'local')
+    assert replicated.mget(['key', 'other']) == ['local', 'value']
+    del replicated['key']
+    assert replicated['key'] is None
+
+
+def test_replicated_reads_fall_back(replicated, memory_nodes):
+    """Test that reads try other nodes on a miss or an error only."""
+
+    def down(*args, **kwargs):
+        raise ConnectionError()
+
+    memory_nodes[0].set('key', 'remote')
+    assert replicated['key'] == 'remote'
+    assert replicated.mget('key', 'missing') == ['remote', None]
+    memory_nodes[2].get = down
+    memory_nodes[2].mget = down
+    memory_nodes[2].set('key', 'local')
+    assert replicated['key'] == 'remote'
+    assert replicated.mget('key') == ['remote']
+    for node in memory_nodes:
+        node.get = down
+    with pytest.raises(ConnectionError):
+        replicated['key']
+
+
+def test_replicated_reads_prefer_fast_nodes(app, memory_nodes):
+    """Test that reads go to the fastest node without a zone, and that
+    read commands are sent to a single node."""
+
+    redis = FlaskMultiRedis(app, strategy='replicated')
+    redis._aggregator._redis_nodes = memory_nodes
+    calls = []
+    for latency, node in zip([0.3, 0.1, 0.2, 0.4], memory_nodes):
+        node.stats = NodeStats()
+        node.stats.end(latency)
+        node.set('key', node.name)
+        node.exists = lambda name, node=node: calls.append(node.name) or 1
+    assert redis['key'] == 'node2'
+    assert redis.exists('key') == 1
+    assert calls == ['node2']
+
+
+def test_repair_skips_concurrent_writes(memory_nodes):
+    """Test that lagging copies are detected and only repaired if they
+    did not change in the meantime."""
+
+    assert not lags((10, 'new'), (11, 'new'))
+    assert lags((3, 'new'), (11, 'new'))
+    assert lags((-1, 'new'), (11, 'new'))
+    assert lags((11, 'old'), (11, 'new'))
+    assert authority([(-2, None), (10, 'new')]) == (10, 'new')
+    assert authority([(-1, 'new'), (300, 'new')]) == (-1, 'new')
+    assert authority([(-1, 'new'), (300, 'old')]) is None
+    assert authority([(-1, 'new'), (-1, 'new'), (300, 'old')]) == \
+        (-1, 'new')
+    assert authority([(-2, None)]) is None
+    node = memory_nodes[0]
+    node.set('key', 'old')
+    assert repair(node, 'key', 'old', (10, 'new'))
+    assert node.data['key'] == 'new'
+    assert node.ttls['key'] == 10
+    assert not repair(node, 'key', 'old', (20, 'newer'))
+    assert node.data['key'] == 'new'
+
+
+def test_aggregator_read_repair(app, memory_nodes):
+    """Test that aggregated reads write a value back to nodes missing it,
+    and only override another value held by a minority of nodes."""
+
+    app.config['REDIS_READ_REPAIR'] = True
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    memory_nodes[0].set('lonely', 'value', ex=100)
+    for node in memory_nodes:
+        node.set('key', 'old', ex=300)
+    for node in memory_nodes[:3]:
+        node.set('key', 'new')
+    memory_nodes[0].set('split', 'new')
+    memory_nodes[1].set('split', 'old', ex=300)
+    redis['lonely']
+    redis['key']
+    redis['split']
+    redis._pool.shutdown()
+    for node in memory_nodes:
+        assert node.data['lonely'] == 'value'
+        assert node.ttls['lonely'] == 100
+        # A persistent value held by most nodes wins over a longer TTL
+        assert node.data['key'] == 'new'
+        assert 'key' not in node.ttls
+    # Without a majority, nothing tells which value is newer
+    assert memory_nodes[0].data['split'] == 'new'
+    assert memory_nodes[1].data['split'] == 'old'
+    assert 'split' not in memory_nodes[2].data
+
+
+def test_replicated_read_repair(replicated, memory_nodes):
+    """Test that replicated reads falling back to another node write the
+    value back to the nodes which missed it, and only to them."""
+
+    def down(*args, **kwargs):
+        raise ConnectionError()
+
+    replicated._aggregator.read_repair = True
+    memory_nodes[0].set('key', 'value', ex=100)
+    memory_nodes[1].pipeline = down
+    assert replicated['key'] == 'value'
+    replicated._pool.shutdown()
+    assert memory_nodes[2].data['key'] == 'value'
+    assert memory_nodes[2].ttls['key'] == 100
+    assert 'key' not in memory_nodes[1].data
+
+
+def test_anti_entropy(memory_nodes):
+    """Test that anti-entropy reconciles every key in batches."""
+
+    aggregator = Aggregator(memory_nodes)
+    for i in range(25):
+        memory_nodes[i % 4].set('key{0}'.format(i), i)
+    for index in [0, 2, 3]:
+        memory_nodes[index].set('key1', 'newer', ex=50)
+    memory_nodes[0].set('key2', 'other')
+    memory_nodes[1].set('hash', 'value')
+    get = memory_nodes[1].get
+
+    def wrongtype_get(name):
+        if name == 'hash':
+            raise ValueError('WRONGTYPE')
+        return get(name)
+    memory_nodes[1].get = wrongtype_get
+    anti_entropy = AntiEntropy(aggregator, batch_size=10, rate=0)
+    anti_entropy.run_once()
+    stats = anti_entropy.stats()
+    assert stats['passes'] == 1
+    assert stats['scanned'] == 26
+    for node in memory_nodes:
+        assert node.data['key1'] == 'newer'
+        for i in range(3, 25):
+            assert node.data['key{0}'.format(i)] == i
+    # Two values held by as many nodes are left alone
+    assert memory_nodes[0].data['key2'] == 'other'
+    assert memory_nodes[2].data['key2'] == 2
+    assert 'key2' not in memory_nodes[1].data
+    assert 'hash' not in memory_nodes[0].data
+    assert stats['repaired'] == 1 + 3 * 23
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis serialization codecs."""
+
+import flask
+from flask_multi_redis.main import FlaskMultiRedis
+from flask_multi_redis.serialization import Codec, _json_dumps, msgpack
+import pytest
+
+
+def test_codec():
+    """Test that values are serialized, compressed above the threshold and
+    that values without a header are left untouched."""
+
+    codec = Codec('json', 'zlib', threshold=100)
+    small = {'potato': 'mashed'}
+    large = {'potatoes': ['mashed'] * 100}
+    assert codec.encode(small).startswith(b'\xfe\x10')
+    assert codec.encode(large).startswith(b'\xfe\x11')
+    assert len(codec.encode(large)) < len(_json_dumps(large))
+    assert codec.decode(codec.encode(small)) == small
+    assert codec.decode(codec.encode(large)) == large
+    assert codec.decode(b'legacy value') == b'legacy value'
+    assert codec.decode(b'\xfe\x10not json') == b'\xfe\x10not json'
+    assert codec.decode(b'\xfe\xff') == b'\xfe\xff'
+    # Values stored with other settings still decode
+    assert codec.decode(Codec(None).encode(u'text')) == b'text'
+    assert Codec(None).decode(codec.encode(small)) == small
+    # Pickles are only loaded by pickle codecs
+    pickled = Codec('pickle').encode(set([1, 2]))
+    assert codec.decode(pickled) == pickled
+    assert Codec('pickle').decode(pickled) == set([1, 2])
+    with pytest.raises(AssertionError):
+        Codec('yaml')
+
+
+@pytest.mark.skipif(msgpack is None, reason='msgpack is not installed')
+def test_codec_msgpack():
+    """Test the msgpack serializer."""
+
+    codec = Codec('msgpack')
+    assert codec.decode(codec.encode({'potato': [1, 2]})) == {'potato': [1, 2]}
+
+
+def test_item_access_codec(app, memory_nodes):
+    """Test that item access encodes and decodes values with the codec."""
+
+    app.config['REDIS_SERIALIZER'] = 'json'
+    app.config['REDIS_COMPRESSION'] = 'zlib'
+    app.config['REDIS_COMPRESSION_THRESHOLD'] = 10
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    value = {'potatoes': ['mashed'] * 10}
+    redis['key'] = value
+    for node in memory_nodes:
+        assert node.data['key'].startswith(b'\xfe\x11')
+    assert redis['key'] == value
+    memory_nodes[0].set('legacy', b'raw')
+    assert redis['legacy'] == b'raw'
+    assert redis['missing'] is None
+    assert FlaskMultiRedis(flask.Flask(__name__)).codec is None
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis sharding strategy."""
+
+import flask
+from flask_multi_redis.hash_ring import HashRing
+from flask_multi_redis.main import FlaskMultiRedis
+from flask_multi_redis.sharder import Sharder
+import pytest
+
+
+def test_hash_ring_distribution(memory_nodes):
+    """Test that the hash ring spreads keys and keeps most of them in place
+    when a node is added."""
+
+    ring = HashRing(memory_nodes[:3])
+    keys = ['key{0}'.format(i) for i in range(3000)]
+    owners = [ring.get_node(key).name for key in keys]
+    for node in memory_nodes[:3]:
+        assert 700 < owners.count(node.name) < 1300
+    ring = HashRing(memory_nodes)
+    moved = [key for key, owner in zip(keys, owners)
+             if ring.get_node(key).name != owner]
+    assert len(moved) < 1200
+    assert all(ring.get_node(key).name == 'node4' for key in moved)
+
+
+def test_hash_ring_replicas(memory_nodes):
+    """Test that replicas are distinct nodes, primary first."""
+
+    ring = HashRing(memory_nodes, replicas=2)
+    owners = ring.get_nodes('key')
+    assert len(owners) == 2
+    assert owners[0] is ring.get_node('key')
+    assert owners[0] is not owners[1]
+    assert HashRing(memory_nodes[:1], replicas=3).replicas == 1
+    assert HashRing([]).get_node('key') is None
+
+
+def test_sharding_configuration(app):
+    """Test that sharding options are read from configuration."""
+
+    app.config['REDIS_NODES'] = [{'host': 'localhost', 'name': 'shard1'}]
+    app.config['REDIS_SHARDING_REPLICAS'] = 2
+    app.config['REDIS_SHARDING_VIRTUAL_NODES'] = 10
+    redis = FlaskMultiRedis(app, strategy='sharding')
+    assert isinstance(redis._aggregator, Sharder)
+    assert redis._aggregator.replicas == 2
+    assert redis._aggregator.vnodes == 10
+    assert redis._redis_nodes[0].name == 'shard1'
+    assert FlaskMultiRedis(flask.Flask(__name__))._redis_nodes[0].name == \
+        'localhost:6379/0'
+
+
+def test_sharded_items(sharded):
+    """Test that item access is routed to the owning node only."""
+
+    ring = sharded._aggregator.ring
+    for i in range(20):
+        sharded['key{0}'.format(i)] = i
+    for node in ring.nodes:
+        for key in node.data:
+            assert ring.get_node(key) is node
+    assert sum(len(node.data) for node in ring.nodes) == 20
+    assert sharded['key3'] == 3
+    del sharded['key3']
+    assert sharded['key3'] is None
+
+
+def test_sharded_proxied_command(sharded):
+    """Test that commands without dedicated method are routed by key."""
+
+    sharded.set('key', 'value')
+    assert sharded.ttl('key') == -1
+    assert sharded.ring.get_node('key').data == {'key': 'value'}
+
+
+def test_sharded_keyless_commands(sharded):
+    """Test that commands without keys run on every node."""
+
+    for i in range(20):
+        sharded['key{0}'.format(i)] = i
+    assert sharded.dbsize() == 20
+    assert sharded.ping() is True
+    with pytest.raises(NotImplementedError):
+        sharded.info()
+
+
+def test_sharded_multi_key_commands(sharded, mocker):
+    """Test that multi-key commands are grouped per shard."""
+
+    nodes = sharded._aggregator.ring.nodes
+    spies = [mocker.spy(node, 'mset') for node in nodes]
+    keys = ['key{0}'.format(i) for i in range(20)]
+    assert sharded.mset(dict((key, key) for key in keys)) is True
+    assert sum(spy.call_count for spy in spies) == 4
+    assert sharded.mget(keys + ['missing']) == keys + [None]
+    assert sharded.delete(*keys[:10]) == 10
+    assert sharded.mget(keys[:10]) == [None] * 10
+
+
+def test_sharded_split_commands(app, memory_nodes):
+    """Test that multi-key commands are split per shard and that commands
+    which cannot be split are refused."""
+
+    app.config['REDIS_SHARDING_REPLICAS'] = 2
+    sharded = FlaskMultiRedis(app, strategy='sharding')
+    sharded._aggregator._redis_nodes = memory_nodes
+    keys = ['key{0}'.format(i) for i in range(8)]
+    for key in keys:
+        sharded[key] = key
+    assert len(set(sharded.ring.get_node(key).name for key in keys)) > 1
+    assert sharded.exists(*keys) == 8
+    assert sharded.exists(keys[0], keys[0], 'missing') == 2
+    assert sharded.touch(*keys) == 8
+    assert sharded.unlink(*keys[:6]) == 6
+    assert sharded.exists(*keys) == 2
+    for node in memory_nodes:
+        assert not set(keys[:6]) & set(node.data)
+    for i, key in enumerate(['s1', 's2', 's3', 's4']):
+        sharded.sadd(key, 'a', 'b{0}'.format(i))
+    assert sharded.sunion(['s1', 's2', 's3', 's4']) == \
+        set(['a', 'b0', 'b1', 'b2', 'b3'])
+    assert sharded.sinter('s1', 's2', 's3', 's4') == set(['a'])
+    pipe = sharded.pipeline()
+    pipe.exists(*keys).unlink(*keys).sinter('s1', 's2', 's3')
+    assert pipe.execute() == [2, 2, set(['a'])]
+    with pytest.raises(NotImplementedError):
+        sharded.sdiff('s1', 's2')
+    with pytest.raises(NotImplementedError):
+        sharded.pipeline().rename('s1', 's2')
+
+
+def test_sharded_replicas(app, memory_nodes):
+    """Test that writes go to every replica and that reads fall back to
+    replicas when the primary node misses or fails."""
+
+    app.config['REDIS_SHARDING_REPLICAS'] = 2
+    sharded = FlaskMultiRedis(app, strategy='sharding')
+    sharded._aggregator._redis_nodes = memory_nodes
+    sharded['key'] = 'value'
+    primary, replica = sharded._aggregator.ring.get_nodes('key')
+    assert replica.data == {'key': 'value'}
+    primary.data.clear()
+    assert sharded['key'] == 'value'
+    assert sharded.mget('key') == ['value']
+    primary.get = primary.mget = None
+    assert sharded['key'] == 'value'
+    assert sharded.mget('key') == ['value']
+    assert sharded.delete('key') == 0
+    assert replica.data == {}
+    sharded['key'] = 'value'
+    assert sharded.expire('key', 10) is True
+    assert sharded.sadd('set', 'member') == 1
+    for node in sharded._aggregator.ring.get_nodes('key'):
+        assert node.ttls == {'key': 10}
+    for node in sharded._aggregator.ring.get_nodes('set'):
+        assert node.data['set'] == {'member'}
+
+
+def test_sharded_pipeline(app, memory_nodes):
+    """Test that sharded pipelines send commands to key owners only."""
+
+    app.config['REDIS_SHARDING_REPLICAS'] = 2
+    redis = FlaskMultiRedis(app, strategy='sharding')
+    redis._aggregator._redis_nodes = memory_nodes
+    ring = redis._aggregator.ring
+    pipe = redis.pipeline()
+    for i in range(20):
+        pipe.set('key{0}'.format(i), i)
+    pipe.mset({'a': 1, 'b': 2})
+    pipe.get('key3')
+    pipe.delete('key1', 'key2', 'missing')
+    assert pipe.execute() == [True] * 21 + [3, 2]
+    for i in range(3, 20):
+        key = 'key{0}'.format(i)
+        owners = ring.get_nodes(key)
+        assert len(owners) == 2
+        for node in memory_nodes:
+            assert (key in node.data) == (node in owners)
+
+
+def test_scripts_in_sharding_mode(sharded, memory_nodes):
+    """Test that scripts run on the owners of their first key."""
+
+    for node in memory_nodes:
+        node.script_load = lambda script: None
+        node.evalsha = lambda sha, numkeys, key, node=node: node.name
+    sharded.register_script('owner', 'return 1')
+    owner = sharded._aggregator.ring.get_node('key')
+    assert sharded.run_script('owner', ['key']) == owner.name
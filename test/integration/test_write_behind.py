@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Integration tests for Flask-Multi-Redis write-behind mode."""
+
+from os import getpid
+
+import flask
+from flask_multi_redis.aggregator import Aggregator
+from flask_multi_redis.main import FlaskMultiRedis
+from flask_multi_redis.write_behind import WriteBehind
+from redis.exceptions import ConnectionError
+
+
+def test_write_behind_coalesces_and_flushes(app, memory_nodes):
+    """Test that write-behind writes are coalesced per key and reach every
+    node once flushed."""
+
+    app.config['REDIS_WRITE_BEHIND'] = True
+    redis = FlaskMultiRedis(app, strategy='aggregate')
+    redis._aggregator._redis_nodes = memory_nodes
+    for node in memory_nodes:
+        node.set('old', 'value')
+    redis['key'] = 'first'
+    redis.set('key', 'second', ex=10)
+    assert redis.delete('old', 'other') == 2
+    assert redis.flush(timeout=1)
+    for node in memory_nodes:
+        assert node.data == {'key': 'second'}
+        assert node.ttls == {'key': 10}
+    stats = redis.write_behind_stats()
+    assert stats['pending'] == 0
+    assert stats['queued'] + stats['coalesced'] == 4
+    assert stats['flushed'] == stats['queued']
+    redis['last'] = 'value'
+    redis.close()
+    assert memory_nodes[0].data['last'] == 'value'
+    assert FlaskMultiRedis(flask.Flask(__name__)).write_behind_stats() is None
+
+
+def test_write_behind_drops_writes_when_full(memory_nodes):
+    """Test that writes are dropped when too many keys are pending."""
+
+    aggregator = Aggregator(memory_nodes)
+    write_behind = WriteBehind(aggregator, max_pending=1, block_timeout=0)
+    write_behind._pid = getpid()  # Keep the flushing thread from starting
+    assert write_behind.set('key1', 'value')
+    assert write_behind.set('key1', 'value')
+    assert not write_behind.set('key2', 'value')
+    assert write_behind.stats()['dropped'] == 1
+    write_behind._pid = None
+    assert write_behind.flush(timeout=1)
+    assert write_behind.set('key2', 'value')
+
+
+def test_write_behind_retries_failing_nodes(memory_nodes):
+    """Test that batches are retried on failing nodes, then given up."""
+
+    def fail(transaction=True):
+        raise ConnectionError('node is down')
+
+    memory_nodes[0].pipeline = fail
+    write_behind = WriteBehind(Aggregator(memory_nodes), retries=2)
+    write_behind.set('key', 'value')
+    write_behind.close()
+    stats = write_behind.stats()
+    assert stats['retried'] == 2
+    assert stats['failed'] == 1
+    assert 'key' not in memory_nodes[0].data
+    assert memory_nodes[1].data['key'] == 'value'